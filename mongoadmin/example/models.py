@@ -7,6 +7,8 @@
     4.only_show_in_list表示原Mongo数据库中不存在, 但在list表格中需要显示的属性.
     5.allowed_edit, 与only_show_in_list相对的概念, 允许在编辑界面中被编辑.
     6.fake_list, 完全不在List,Add,Edit中显示, 在model中用作另外的用途.
+    7.transform_requires, 字典: `transform_`函数需要的其他属性, list页面只从Mongo中读取显示的列,
+    排序的属性以及这里声明的属性. 如: {'nickname': ('uid', )}.
 
 常用AdminField说明:
 1.含有前缀Admin的Field继承自MongoEngine原有的Field, 只是增加了widget, form_fild,
@@ -105,6 +107,10 @@ class MiccardAnchor(Document):
         'id': u'详情'
     }
 
+    transform_requires = {
+        'nickname': ('uid', ),
+    }
+
     def transform_last_editor(self, value):
         return get_last_editor(self, APP_LABEL)
 
@@ -97,6 +97,35 @@ class MongoTests(TestCase):
 
         self.delete_MiccardAnchor(object_id)
 
+    def test_partial_edit_MiccardAnchor(self):
+        object_id, url = self.add_MiccardAnchor()
+        # not on the form, kept by a partial update.
+        MiccardAnchor.objects(pk=object_id).update_one(set__last_editor=u'editor')
+        kwargs = {'id': object_id}
+        kwargs.update(self.com_kwargs)
+        url_path = reverse('document_detail_edit_form', kwargs=kwargs)
+        edit_data = POST_DATA.copy()
+        edit_data['middleman_user_name'] = 'new_user_name'
+
+        self.client.post(url_path, data=edit_data)
+        anchor = MiccardAnchor.objects.get(pk=object_id)
+        self.assertEqual(anchor.middleman.user_name, 'new_user_name')
+        self.assertEqual(anchor.last_editor, u'editor')
+
+        self.delete_MiccardAnchor(object_id)
+
+    def test_export_MiccardAnchor(self):
+        object_id, url = self.add_MiccardAnchor()
+        for export_format in ('csv', 'jsonl'):
+            kwargs = {'export_format': export_format}
+            kwargs.update(self.com_kwargs)
+            response = self.client.get(reverse('document_export', kwargs=kwargs))
+            self.assertEqual(response.status_code, 200)
+            content = ''.join(response.streaming_content)
+            self.assertIn(object_id, content)
+
+        self.delete_MiccardAnchor(object_id)
+
     def test_multi_search(self):
         objects_list = []
         uid_list = []
@@ -121,5 +150,5 @@ class MongoTests(TestCase):
         # multi delete
         url_path = reverse('document_list', kwargs=self.com_kwargs)
         response = self.client.post(url_path, data={'mongo_id': tuple(objects_list)})
-        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.status_code, 302)
         self.assertEqual(origin_count, MiccardAnchor.objects.count())
@@ -1,4 +1,7 @@
 # -*- coding: utf-8 -*-
+import os
+import tempfile
+
 from django.conf import settings  # @UnusedImport, not obviously used but need.
 from appconf import AppConf
 
@@ -7,6 +10,15 @@ class MongonautConf(AppConf):
     FIELD_TABLE = {}
     APP_TABLE = {}
     LIST_MAX_SHOW = 3
+    # A running job is taken over by another worker after no heartbeat for these seconds.
+    JOB_TIMEOUT = 300
+    # Directory of the files of background export, keep it out of public
+    # media: files are downloaded through the `document_job_download` view.
+    EXPORT_ROOT = os.path.join(tempfile.gettempdir(), 'mongonaut_export')
+    # Choices of AdminReferenceField(cache_choices=True): collections kept
+    # in the in-process LRU, and seconds kept in django cache.
+    REFERENCE_CACHE_SIZE = 100
+    REFERENCE_CACHE_TIMEOUT = 60 * 60
 
     # CSS File CDN
     METISMENU_CSS = "http://cdn.bootcss.com/metisMenu/1.1.0/metisMenu.min.css"
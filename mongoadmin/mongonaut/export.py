@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+Export documents of the list view as CSV or JSON Lines.
+
+Columns are the keys of the list view, values go through the same
+`transform_*` methods of the Document as the list page, without html.
+"""
+from __future__ import absolute_import
+import csv
+import datetime
+import json
+
+from bson.objectid import ObjectId
+from django.utils.encoding import force_text
+from django.utils.html import strip_tags
+from mongoengine.base import BaseDocument
+
+from .templatetags.mongonaut_tags import get_document_key
+from .utils import prefetch_references
+
+
+def get_export_value(document, key):
+    """Value of document[key] that can be written to csv or json."""
+    value = getattr(document, key, '')
+
+    # user-defined method
+    transform_method = getattr(document, 'transform_{key}'.format(key=key), None)
+    if callable(transform_method):
+        value = transform_method(value)
+        if isinstance(value, basestring):
+            return strip_tags(value).strip()
+
+    return to_export_value(value)
+
+
+def to_export_value(value):
+    if value is None or isinstance(value, (bool, int, long, float)):
+        return value
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    if isinstance(value, (list, tuple)):
+        return [to_export_value(item) for item in value]
+    if isinstance(value, BaseDocument):
+        try:
+            return force_text(value.__unicode__())
+        except AttributeError:
+            return force_text(value)
+    if isinstance(value, ObjectId):
+        return unicode(value)
+    return force_text(value)
+
+
+def iter_documents(queryset, keys, batch_size):
+    """Documents of queryset, references prefetched in batches."""
+    batch = []
+    for document in queryset:
+        batch.append(document)
+        if len(batch) >= batch_size:
+            for document in prefetch_references(batch, keys):
+                yield document
+            batch = []
+    for document in prefetch_references(batch, keys):
+        yield document
+
+
+class Echo(object):
+    """File-like object that returns what is written, for csv.writer."""
+    def write(self, value):
+        return value
+
+
+def encode_csv_value(value):
+    if isinstance(value, list):
+        value = u", ".join(force_text(item) for item in value)
+    if value is None:
+        value = u''
+    return force_text(value).encode('utf-8')
+
+
+def export_csv(document_type, keys, documents):
+    writer = csv.writer(Echo())
+    # BOM, so excel reads utf-8.
+    yield '\xef\xbb\xbf'
+    yield writer.writerow([encode_csv_value(get_document_key(document_type, key))
+                           for key in keys])
+    for document in documents:
+        yield writer.writerow([encode_csv_value(get_export_value(document, key))
+                               for key in keys])
+
+
+def export_jsonl(document_type, keys, documents):
+    for document in documents:
+        row = dict((key, get_export_value(document, key)) for key in keys)
+        yield json.dumps(row, ensure_ascii=False).encode('utf-8') + '\n'
+
+
+# format: (writer, content_type)
+EXPORT_FORMATS = {
+    'csv': (export_csv, 'text/csv; charset=utf-8'),
+    'jsonl': (export_jsonl, 'application/x-ndjson; charset=utf-8'),
+}
@@ -25,14 +25,15 @@ from django.core.files.uploadedfile import UploadedFile
 from django.core.files.storage import default_storage
 from django.utils.encoding import force_str, force_text
 
-from mongoengine import StringField, IntField, URLField, EmailField
+from mongoengine import StringField, IntField, URLField, EmailField, ReferenceField
 
 from .forms.widgets import MongoImageWidget, MongoSelectWidget, IntChoiceField
+from .reference_cache import register
 
 logger = logging.getLogger(__name__)
 
 __all__ = ['AdminStringField', 'AdminUnsignedIntField', 'AdminIntSelectField',
-           'AdminURLField', 'AdminEmailField', 'AdminImageURLField']
+           'AdminURLField', 'AdminEmailField', 'AdminImageURLField', 'AdminReferenceField']
 
 
 class AdminStringField(StringField):
@@ -211,6 +212,39 @@ class AdminEmailField(EmailField):
             self.validate_js += validate_js
 
 
+class AdminReferenceField(ReferenceField):
+    """
+    cache_choices: 引用的是小的字典表(地区, 分类等)时, 表单渲染全部选项,
+    选项列表缓存在进程内LRU与django cache中, 引用文档post_save/post_delete时失效,
+    见mongonaut.reference_cache. 否则与ReferenceField一样按输入搜索.
+    """
+    def __init__(self, document_type, cache_choices=False, widget=None, form_field=None,
+                 validate_js=[], attr_list=[], **kwargs):
+        self.cache_choices = cache_choices
+        self.widget = widget
+        self.form_field = form_field
+        super(AdminReferenceField, self).__init__(document_type, **kwargs)
+        self.validate_js = []
+        self.attr_list = attr_list
+        self.process_validate_js(validate_js)
+        # a class name is registered when it is resolved, see document_type.
+        if cache_choices and not isinstance(document_type, basestring):
+            register(document_type)
+
+    @property
+    def document_type(self):
+        document_type = ReferenceField.document_type.fget(self)
+        if self.cache_choices:
+            register(document_type)
+        return document_type
+
+    def process_validate_js(self, validate_js):
+        if self.required:
+            self.validate_js.append(('required', 'true'))
+        if isinstance(validate_js, list):
+            self.validate_js += validate_js
+
+
 class AdminImageURLField(AdminStringField):
     """
     Acutally, this filed save the return url and
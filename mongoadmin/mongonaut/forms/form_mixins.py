@@ -1,7 +1,5 @@
 # -*- coding: utf-8 -*-
 
-from copy import deepcopy
-
 from django import forms
 from django.utils.datastructures import SortedDict
 from mongoengine.base import BaseList
@@ -14,8 +12,10 @@ from mongoengine.fields import ReferenceField
 from .form_utils import FieldTuple
 from .form_utils import has_digit
 from .form_utils import make_key
-from .widgets import get_form_field_class, get_form_field_class_from_widget, IntChoiceField
-from mongonaut.utils import trim_field_key
+from .widgets import (get_form_field_class, get_form_field_class_from_widget, IntChoiceField,
+                      ReferenceChoiceField, clone_widget)
+from mongonaut.utils import trim_field_key, get_reference_id
+from mongonaut.reference_cache import get_cached_choices
 
 
 CHECK_ATTRS = {'required': 'required',
@@ -34,11 +34,19 @@ class MongoForm(forms.Form):
     @property
     def media(self):
         """
-        Provide a description of all media required to render the widgets on this form
+        Provide a description of all media required to render the widgets on this form.
+        Compiled once per Document class(FormSchema.media) for MongoModelForm.
         """
+        schema_media = getattr(self, 'schema_media', None)
+        if schema_media is not None:
+            return schema_media
         media = forms.Media()
+        widget_classes = set()
         for field in self.fields.values():
-            media = media + field.widget.media
+            # widget media depend on the widget class, add each class once.
+            if field.widget.__class__ not in widget_classes:
+                widget_classes.add(field.widget.__class__)
+                media = media + field.widget.media
         # Add some media that validation need.
         if hasattr(self, 'validation_media'):
             media += self.validation_media
@@ -92,8 +100,8 @@ class MongoModelFormBaseMixin(object):
     def get_form_field_dict(self, model_dict):
         """
         Takes a model dictionary representation and creates a dictionary
-        keyed by form field.  Each value is a keyed 4 tuple of:
-        (widget, mode_field_instance, model_field_type, field_key)
+        keyed by form field.  Each value is a keyed 5 tuple of:
+        (widget, mode_field_instance, model_field_type, field_key, form_field_class)
         """
         return_dict = SortedDict()
         for field_key, field_dict in model_dict.iteritems():
@@ -104,12 +112,29 @@ class MongoModelFormBaseMixin(object):
                     return_dict[field_key] = self.get_form_field_dict(field_dict)
                     return_dict[field_key].update({'_field_type': field_dict.get('_field_type', None)})
                 else:
+                    document_field = field_dict.get('_document_field', None)
                     return_dict[field_key] = FieldTuple(widget,
-                                             field_dict.get('_document_field', None),
+                                             document_field,
                                              field_dict.get('_field_type', None),
-                                             field_dict.get('_key', None))
+                                             field_dict.get('_key', None),
+                                             self.get_form_field_class(widget, document_field))
         return return_dict
 
+    def get_form_field_class(self, widget, model_field):
+        """Form field class of model_field shown with widget."""
+        # 优先widget匹配, 否则mongo field匹配.
+        # TODO: 先从model_field获取form_field字段, 后根据widget字段获取.
+        if getattr(model_field, 'widget', None):
+            return get_form_field_class_from_widget(model_field, widget)
+        elif isinstance(model_field, ReferenceField):
+            # all choices are rendered only with cache_choices.
+            return forms.ChoiceField if getattr(model_field, 'cache_choices', False) \
+                else ReferenceChoiceField
+        elif widget and isinstance(widget, forms.Select):
+            return forms.ChoiceField
+        else:
+            return get_form_field_class(model_field)
+
     def set_form_fields(self, form_field_dict, parent_key=None, field_type=None):
         """
         Set the form fields for every key in the form_field_dict.
@@ -122,6 +147,8 @@ class MongoModelFormBaseMixin(object):
         for form_key, field_value in form_field_dict.iteritems():
             form_key = make_key(parent_key, form_key) if parent_key is not None else form_key
             if isinstance(field_value, tuple):
+                # the widget of form_field_dict is shared, change a copy.
+                field_value = field_value._replace(widget=clone_widget(field_value.widget))
 
                 set_list_class = False
                 base_key = form_key
@@ -138,14 +165,7 @@ class MongoModelFormBaseMixin(object):
                     else:
                         field_value.widget.attrs['class'] += ' listField'
 
-                    # Compute number value for list key according to existed form.fields
-                    list_keys = [field_key for field_key in self.form.fields.keys()
-                                           if has_digit(field_key)]
-
-                    key_int = 0
-                    while form_key in list_keys:
-                        key_int += 1
-                    form_key = make_key(form_key, key_int)
+                    form_key = make_key(form_key, self.next_list_index(form_key))
 
                 if parent_key is not None:
 
@@ -178,21 +198,40 @@ class MongoModelFormBaseMixin(object):
                     key_index = int(form_key.split("_")[-1])
                     new_base_key = make_key(form_key, exclude_last_string=True)
 
+                    if isinstance(field_value.document_field, ReferenceField) and \
+                            not getattr(field_value.document_field, 'cache_choices', False):
+                        # labels of all selected documents in one query.
+                        self.load_references(field_value.document_field.document_type,
+                                             [get_reference_id(list_value) for list_value in default_value
+                                              if get_reference_id(list_value) is not None])
+
                     for list_value in default_value:
                         # Note, this is copied every time so each widget gets a different class
-                        list_widget = deepcopy(field_value.widget)
+                        list_widget = clone_widget(field_value.widget)
                         new_key = make_key(new_base_key, unicode(key_index))
                         list_widget.attrs['class'] += " {0}".format(make_key(base_key, key_index))
-                        self.set_form_field(list_widget, field_value.document_field, new_key, list_value)
+                        self.set_form_field(list_widget, field_value.document_field, new_key, list_value,
+                                            field_value.field_class)
                         key_index += 1
                 else:
                     self.set_form_field(field_value.widget, field_value.document_field,
-                                        form_key, default_value)
+                                        form_key, default_value, field_value.field_class)
 
             elif isinstance(field_value, dict):
                 self.set_form_fields(field_value, form_key, field_value.get("_field_type", None))
 
-    def set_form_field(self, widget, model_field, field_key, default_value):
+    def next_list_index(self, list_key):
+        """
+        Number of the first element of a list key, counted per key, instead
+        of scanning the keys already on the form.
+        """
+        if not hasattr(self, 'list_indexes'):
+            self.list_indexes = {}
+        index = self.list_indexes.get(list_key, 0)
+        self.list_indexes[list_key] = index + 1
+        return index
+
+    def set_form_field(self, widget, model_field, field_key, default_value, field_class=None):
         """
         Parmams:
             widget -- the widget to use for displyaing the model_field
@@ -200,19 +239,14 @@ class MongoModelFormBaseMixin(object):
             field_key -- the name for the field on the form
             default_value -- the value to give for the field
                              Default: None
+            field_class -- form field class, computed from widget and model_field if None
         """
         # Empty lists cause issues on form validation
         if default_value == []:
             default_value = None
 
-        # 优先widget匹配, 否则mongo field匹配.
-        # TODO: 先从model_field获取form_field字段, 后根据widget字段获取.
-        if getattr(model_field, 'widget', None):
-            field_class = get_form_field_class_from_widget(model_field, widget)
-        elif widget and isinstance(widget, forms.Select):
-            field_class = forms.ChoiceField
-        else:
-            field_class = get_form_field_class(model_field)
+        if field_class is None:
+            field_class = self.get_form_field_class(widget, model_field)
 
         if field_class is IntChoiceField:
             # 单独处理AdminIntSelectField
@@ -224,7 +258,19 @@ class MongoModelFormBaseMixin(object):
                                                   required=model_field.required,
                                                   widget=widget)
 
-        if default_value is not None:
+        if isinstance(model_field, ReferenceField):
+            if getattr(model_field, 'cache_choices', False):
+                # Small lookup collection, all cached choices.
+                self.form.fields[field_key].initial = self.get_reference_initial(default_value)
+                choices = get_cached_choices(model_field.document_type)
+            else:
+                # Only the selected document, others are searched by the widget.
+                self.form.fields[field_key].initial, choices = self.get_reference_choices(
+                    model_field, default_value)
+            # Adding in blank choice so a reference field can be deleted by selecting blank
+            self.form.fields[field_key].choices = [("", "")] + choices
+
+        elif default_value is not None:
             if isinstance(default_value, Document):
                 # Probably a reference field, therefore, add id
                 self.form.fields[field_key].initial = getattr(default_value, 'id', None)
@@ -233,13 +279,7 @@ class MongoModelFormBaseMixin(object):
         else:
             self.form.fields[field_key].initial = getattr(model_field, 'default', None)
 
-        if isinstance(model_field, ReferenceField):
-            self.form.fields[field_key].choices = [(unicode(x.id), get_document_unicode(x))
-                                                    for x in model_field.document_type.objects.all()]
-            # Adding in blank choice so a reference field can be deleted by selecting blank
-            self.form.fields[field_key].choices.insert(0, ("", ""))
-
-        elif model_field.choices:
+        if not isinstance(model_field, ReferenceField) and model_field.choices:
             self.form.fields[field_key].choices = model_field.choices
 
         for key in CHECK_ATTRS.keys():
@@ -247,6 +287,40 @@ class MongoModelFormBaseMixin(object):
                 value = getattr(model_field, key)
                 setattr(self.form.fields[field_key], key, value)
 
+    def get_reference_choices(self, model_field, value):
+        """
+        (initial, choices) of a ReferenceField select with the selected
+        document only. value is a Document, DBRef or id.
+        """
+        if value is None:
+            return None, []
+        reference_id = get_reference_id(value)
+        if reference_id is None:
+            document = value
+        else:
+            document = self.load_references(model_field.document_type, [reference_id])\
+                .get(reference_id)
+            if document is None:
+                return None, []
+        return unicode(document.pk), [(unicode(document.pk), get_document_unicode(document))]
+
+    def get_reference_initial(self, value):
+        """Id of a Document, DBRef or id, without loading the document."""
+        if value is None:
+            return None
+        reference_id = get_reference_id(value)
+        return unicode(value.pk if reference_id is None else reference_id)
+
+    def load_references(self, document_type, reference_ids):
+        """Referenced documents by id, loaded with one `$in` per form and collection."""
+        if not hasattr(self, 'references'):
+            self.references = {}
+        loaded = self.references.setdefault(document_type, {})
+        missing = [reference_id for reference_id in reference_ids if reference_id not in loaded]
+        if missing:
+            loaded.update(document_type.objects.in_bulk(missing))
+        return loaded
+
     def get_field_value(self, field_key):
         """
         Given field_key will return value held at self.model_instance.  If
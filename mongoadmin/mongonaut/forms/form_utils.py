@@ -10,7 +10,9 @@ from collections import namedtuple
 
 # Used by form_mixin processing to allow named access to
 # field elements in the tuple.
-FieldTuple = namedtuple('FieldTuple', 'widget document_field field_type key')
+# widget is a prototype shared by all forms of the Document, copy it
+# before changing.
+FieldTuple = namedtuple('FieldTuple', 'widget document_field field_type key field_class')
 
 
 def has_digit(string_or_list, sep="_"):
@@ -1,4 +1,5 @@
 # -*- coding: utf-8 -*-
+from collections import defaultdict, namedtuple
 
 from django import forms
 from mongoengine.base import TopLevelDocumentMetaclass
@@ -14,6 +15,15 @@ from django.utils.datastructures import SortedDict
 from django.utils.safestring import mark_safe
 
 
+# Widgets, form field classes and validation of a Document class do not
+# change between requests, they are compiled once, see MongoModelForm.get_schema.
+# widgets of form_field_dict are prototypes, copied for each form.
+# media combines the media of the widget classes and validation media.
+FormSchema = namedtuple('FormSchema', 'form_field_dict valid_base_keys validations validation_media media')
+
+FORM_SCHEMAS = {}
+
+
 class MongoModelForm(MongoModelFormBaseMixin, forms.Form):
     """
     This class will take a model and generate a form for the model.
@@ -36,48 +46,83 @@ class MongoModelForm(MongoModelFormBaseMixin, forms.Form):
         super(MongoModelForm, self).__init__(*args, **kwargs)
 
     def set_fields(self):
+        schema = self.get_schema()
+        self.form.validations = schema.validations
+        if schema.validation_media is not None:
+            self.form.validation_media = schema.validation_media
+        self.form.schema_media = schema.media
 
-        # Get dictionary map of current model
-        # 由mongo_filed获取widget.
-        if self.is_initialized:
-            self.model_map_dict = self.create_document_dictionary(self.model_instance)
-        else:
-            self.model_map_dict = self.create_document_dictionary(self.model)
-
-        form_field_dict = self.get_form_field_dict(self.model_map_dict)
+        # Get base key for embedded field class, used in self.set_form_fields
+        self.valid_base_keys = schema.valid_base_keys
+        self.set_form_fields(schema.form_field_dict)
 
-        self.set_validate_js(form_field_dict)
+    def get_schema(self):
+        """FormSchema of self.model, compiled on the first form of the Document."""
+        schema = FORM_SCHEMAS.get(self.model)
+        if schema is None:
+            schema = FORM_SCHEMAS[self.model] = self.compile_schema()
+        return schema
 
-        # Get base key for embedded field class, used in self.set_form_fields
-        self.valid_base_keys = [model_key for model_key in self.model_map_dict.keys()
-                                if not model_key.startswith("_")]
-        self.set_form_fields(form_field_dict)
+    def compile_schema(self):
+        # Get dictionary map of current model
+        # 由mongo_filed获取widget.
+        model_map_dict = self.create_document_dictionary(self.model)
+        form_field_dict = self.get_form_field_dict(model_map_dict)
+        validations, validation_media = self.get_validate_js(form_field_dict)
+        valid_base_keys = frozenset(model_key for model_key in model_map_dict.keys()
+                                    if not model_key.startswith("_"))
+        media = get_widget_media(form_field_dict)
+        if validation_media is not None:
+            media += validation_media
+        return FormSchema(form_field_dict, valid_base_keys, validations, validation_media, media)
 
     def set_post_data(self):
         # Need to set form data so that validation on all post data occurs and
         # places newly entered form data on the form object.
         self.form.data = self.post_data_dict
 
-        form_fields = self.form.fields.copy()
+        elements, split_elements = self.get_post_key_index()
+        bound_base_keys = set()
         # Specifically adding list field keys to the form so they are included
         # in form.cleaned_data after the call to is_valid
-        for field_key, field in form_fields.iteritems():
-            if has_digit(field_key):
-                # We have a list field.
-                base_key = make_key(field_key, exclude_last_string=True)
-
-                # Add new key value with field to form fields so validation
-                # will work correctly
-                if isinstance(field, forms.SplitDateTimeField):
-                    # rstrip `_0` and `_1`
-                    self.update_fields(-2, field, base_key)
-                else:
-                    self.update_fields(None, field, base_key)
-
-    def update_fields(self, index, field, base_key):
+        for field_key, field in self.form.fields.items():
+            if not has_digit(field_key):
+                continue
+            # We have a list field, bind its posted elements once.
+            base_key = make_key(field_key, exclude_last_string=True)
+            if base_key in bound_base_keys:
+                continue
+            bound_base_keys.add(base_key)
+
+            if isinstance(field, forms.SplitDateTimeField):
+                # posted as `<key>_0` and `<key>_1`
+                self.update_fields(split_elements.get(base_key, ()), field)
+            else:
+                self.update_fields(elements.get(base_key, ()), field)
+
+    def get_post_key_index(self):
+        """
+        Group list element keys of POST by base key, in one pass.
+        @return: (elements, split_elements)
+            elements: {'tags': set(['tags_0', 'tags_1'])}
+            split_elements: {'dates': set(['dates_0'])} from `dates_0_0`, `dates_0_1`
+        """
+        elements, split_elements = defaultdict(set), defaultdict(set)
         for key in self.post_data_dict.keys():
-            if base_key in key:
-                self.form.fields.update({key[:index]: field})
+            base_key, _, index = key.rpartition('_')
+            if not base_key or not index.isdigit():
+                continue
+            elements[base_key].add(key)
+            split_base_key, _, split_index = base_key.rpartition('_')
+            if split_base_key and split_index.isdigit():
+                split_elements[split_base_key].add(base_key)
+        return elements, split_elements
+
+    def update_fields(self, keys, field):
+        """Add posted list element keys missing on the form, with field of the same list."""
+        for key in keys:
+            if key not in self.form.fields:
+                self.form.fields[key] = field
 
     def get_form(self):
         self.set_fields()
@@ -114,6 +159,8 @@ class MongoModelForm(MongoModelFormBaseMixin, forms.Form):
             # TODO: getattr from document, not from mongoadmin.
             # so can remove if isinstance(document, TopLevelDocumentMetaclass)
             show_in_edit = getattr(document.mongoadmin, 'show_in_edit', ())
+            # 分页编辑的列表, 不在表单中.
+            paged_list_fields = getattr(document.mongoadmin, 'paged_list_fields', ())
             # 与only_show_in_list相对的概念, 允许在Add, Edit界面中被编辑.
             allowed_edit = getattr(document, 'allowed_edit', document._fields_ordered)
             # 一定要有id, 否则无法修改数据.
@@ -123,12 +170,14 @@ class MongoModelForm(MongoModelFormBaseMixin, forms.Form):
             # 完全不在List,Add,Edit中显示, 在model中用作另外的用途.
             fake_list = getattr(document, 'fake_list', ())
         else:
-            only_show_in_list, fake_list, show_in_edit = (), (), ()
+            only_show_in_list, fake_list, show_in_edit, paged_list_fields = (), (), (), ()
             allowed_edit = document._fields_ordered
 
         for key in allowed_edit:
             if key in only_show_in_list or key in show_in_edit:
                 continue
+            if key in paged_list_fields:
+                continue
             if key in fake_list:
                 continue
             field = document._fields.get(key)
@@ -186,7 +235,8 @@ class MongoModelForm(MongoModelFormBaseMixin, forms.Form):
 
         return doc_dict
 
-    def set_validate_js(self, form_field_dict):
+    def get_validate_js(self, form_field_dict):
+        """@return: (JsOption, forms.Media or None)"""
         js_option = JsOption()
         media = forms.Media()
         has_js = False
@@ -201,9 +251,26 @@ class MongoModelForm(MongoModelFormBaseMixin, forms.Form):
                     media += forms.Media(js=[static("js/validate/{0}".format(element[-1]))])
                     has_js = True
             js_option[form_key] = validate_js
-        self.form.validations = js_option
-        if has_js:
-            self.form.validation_media = media
+        return js_option, media if has_js else None
+
+
+def get_widget_media(form_field_dict):
+    """
+    Media of the widgets of form_field_dict(and embedded dicts). Widget
+    media depend on the widget class, each class is added once.
+    """
+    media = forms.Media()
+    widget_classes = set()
+    stack = [form_field_dict]
+    while stack:
+        for field_value in stack.pop().itervalues():
+            if isinstance(field_value, dict):
+                stack.append(field_value)
+            elif hasattr(field_value, 'widget') and field_value.widget is not None and \
+                    field_value.widget.__class__ not in widget_classes:
+                widget_classes.add(field_value.widget.__class__)
+                media += field_value.widget.media
+    return media
 
 
 class JsOption(object):
@@ -230,17 +297,22 @@ class JsOption(object):
 
     def __init__(self):
         self.media_attrs = {}
+        # rendered rules, kept until the rules change.
+        self.render_text = None
 
     def __str__(self):
-        render_text = ""
-        for k, v in self.media_attrs.items():
-            v = " ".join("{0}: {1}, ".format(ele[0], ele[1]) for ele in v)
-            render_text += "%s: { %s },\n" % (k, v)
-        return mark_safe(render_text)
+        if self.render_text is None:
+            render_text = ""
+            for k, v in self.media_attrs.items():
+                v = " ".join("{0}: {1}, ".format(ele[0], ele[1]) for ele in v)
+                render_text += "%s: { %s },\n" % (k, v)
+            self.render_text = mark_safe(render_text)
+        return self.render_text
 
     def __setitem__(self, name, value):
         if value:
             self.media_attrs[name] = value
+            self.render_text = None
 
     def __getitem__(self, name):
         return self.media_attrs.get(name, '')
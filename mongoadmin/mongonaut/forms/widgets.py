@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 
 """ Widgets for mongonaut forms"""
+import copy
 import datetime
 from pytz import utc
 
@@ -106,6 +107,24 @@ class MongoSelectWidget(forms.Select):
         super(MongoSelectWidget, self).__init__(attrs=final_attrs, choices=choices)
 
 
+class MongoReferenceWidget(forms.Select):
+    """
+    Select of ReferenceField, searched as you type. Only the selected value
+    is rendered, other choices come from the `document_reference` json view.
+    """
+
+    @property
+    def media(self):
+        return forms.Media(js=[static('mongonaut/js/reference.js'), ])
+
+    def __init__(self, attrs=None, choices=()):
+        final_attrs = {'class': 'reference-autocomplete'}
+        if attrs is not None:
+            final_attrs.update(attrs)
+            final_attrs['class'] = u"{0} reference-autocomplete".format(attrs.get('class', ''))
+        super(MongoReferenceWidget, self).__init__(attrs=final_attrs, choices=choices)
+
+
 class MongoLocationWidget(forms.Select):
     """自定义位置控件"""
     def render(self, name, value, attrs=None, choices=()):
@@ -250,6 +269,17 @@ class MongoSplitDateTime(forms.MultiWidget):
         return [None, None]
 
 
+def clone_widget(widget):
+    """
+    Copy of widget with its own attrs, cheaper than deepcopy.
+    Only attrs is changed by form building, choices and sub widgets are
+    shared(forms.Field deep copies the widget again).
+    """
+    clone = copy.copy(widget)
+    clone.attrs = widget.attrs.copy()
+    return clone
+
+
 def get_widget(model_field, disabled=False):
 
     widget = getattr(model_field, 'widget', None)
@@ -275,7 +305,10 @@ def get_widget(model_field, disabled=False):
         return forms.CheckboxInput(attrs=attrs)
 
     elif isinstance(model_field, ReferenceField):
-        return forms.Select(attrs=attrs)
+        if getattr(model_field, 'cache_choices', False):
+            # all choices rendered, see AdminReferenceField.
+            return MongoSelectWidget(attrs=attrs)
+        return MongoReferenceWidget(attrs=attrs)
 
     elif model_field.choices:
         return MongoSelectWidget(attrs=attrs)
@@ -344,6 +377,15 @@ def get_form_field_class_from_widget(field, widget):
 
 
 # --------------------------Form Field--------------------------------
+class ReferenceChoiceField(forms.ChoiceField):
+    """
+    Choices are not all rendered(see MongoReferenceWidget), any id is
+    accepted here and checked against the referenced collection on save.
+    """
+    def valid_value(self, value):
+        return True
+
+
 class IntChoiceField(forms.ChoiceField):
     """将前端返回的值改为int而非原来的unicode"""
     def to_python(self, value):
@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+"""
+Background jobs, run by `python manage.py mongonaut_worker`.
+
+A job is saved in the `mongonaut_job` collection with the raw mongo query
+built by the list view. The worker claims pending jobs and records a
+checkpoint after every batch, so a job resumes from its checkpoint when
+the worker is restarted.
+"""
+from __future__ import absolute_import
+import datetime
+import gzip
+import logging
+import tempfile
+import time
+
+from bson import json_util
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.core.urlresolvers import reverse
+from mongoengine import (Document, StringField, IntField, FloatField,
+                         DateTimeField, DynamicField, ListField)
+from mongoengine import connection
+from mongoengine.queryset import Q
+
+from .conf import settings
+from .exceptions import NoMongoAdminSpecified
+from .export import EXPORT_FORMATS
+from .registry import registry
+from .utils import prefetch_references
+
+logger = logging.getLogger(__name__)
+
+JOB_PENDING = 'pending'
+JOB_RUNNING = 'running'
+JOB_DONE = 'done'
+JOB_FAILED = 'failed'
+
+
+class MongonautJob(Document):
+    """后台任务"""
+    kind = StringField(required=True)
+    app_label = StringField(required=True)
+    document_name = StringField(required=True)
+    # mongo query in json(bson.json_util).
+    query = StringField(default='{}')
+    user_id = IntField()
+    status = StringField(default=JOB_PENDING)
+    batch_size = IntField(default=1000)
+    # documents per second, None for no limit.
+    rate = FloatField()
+    # checkpoint, _id of the last processed document.
+    last_id = DynamicField()
+    processed = IntField(default=0)
+    total = IntField()
+    error = StringField()
+    # export jobs: format, columns and the name of the gzipped file in
+    # get_export_storage().
+    export_format = StringField()
+    keys = ListField(StringField())
+    result_file = StringField()
+    created_date = DateTimeField(default=datetime.datetime.utcnow)
+    # heartbeat of the worker.
+    updated_date = DateTimeField()
+
+    meta = {
+        'collection': 'mongonaut_job',
+        'indexes': ['status', ('app_label', 'document_name')],
+        'ordering': ['-created_date'],
+    }
+
+    def get_query(self):
+        return json_util.loads(self.query)
+
+    def update_progress(self, last_id, count):
+        """Save the checkpoint after a batch."""
+        self.update(set__last_id=last_id, inc__processed=count,
+                    set__updated_date=datetime.datetime.utcnow())
+        self.last_id = last_id
+        self.processed += count
+
+    def to_json(self):
+        return {'id': unicode(self.id),
+                'kind': self.kind,
+                'status': self.status,
+                'processed': self.processed,
+                'total': self.total,
+                'error': self.error,
+                'result_url': self.get_result_url()}
+
+    def get_result_url(self):
+        """Download url of an export, checked by the view, None if not exported yet."""
+        if not self.result_file:
+            return None
+        return reverse('document_job_download', kwargs={'app_label': self.app_label,
+                                                        'document_name': self.document_name,
+                                                        'job_id': self.id})
+
+
+def get_export_storage():
+    """Storage of export files, in MONGONAUT_EXPORT_ROOT, never served as media."""
+    return FileSystemStorage(location=settings.MONGONAUT_EXPORT_ROOT)
+
+
+def create_job(kind, app_label, document_name, queryset, user=None, **kwargs):
+    """Save a pending job for the query of queryset."""
+    return MongonautJob.objects.create(kind=kind,
+                                       app_label=app_label,
+                                       document_name=document_name,
+                                       query=json_util.dumps(queryset._query),
+                                       user_id=user.pk if user else None,
+                                       **kwargs)
+
+
+def get_document(app_label, document_name):
+    entry = registry.get(app_label, document_name)
+    if entry is None:
+        raise NoMongoAdminSpecified("No MongoAdmin for {0}.{1}".format(app_label, document_name))
+    return entry.document
+
+
+def iter_id_batches(job, collection):
+    """
+    Yield (first_id, last_id) of bounded `_id` ranges of the documents
+    matching job query, starting from the job checkpoint.
+    """
+    query = job.get_query()
+    while True:
+        batch_query = query
+        if job.last_id is not None:
+            batch_query = {'$and': [query, {'_id': {'$gt': job.last_id}}]}
+        ids = [son['_id'] for son in collection.find(batch_query, {'_id': 1})
+               .sort('_id', 1).limit(job.batch_size)]
+        if not ids:
+            break
+        yield ids[0], ids[-1]
+
+
+def throttle(job, count, started):
+    """Sleep to keep job.rate documents per second."""
+    if job.rate:
+        wait = count / job.rate - (time.time() - started)
+        if wait > 0:
+            time.sleep(wait)
+
+
+def run_delete_job(job, document):
+    """
+    Delete all documents matching the job query in `_id` ranges.
+    Note: delete rules and signals of mongoengine are not applied.
+    """
+    collection = document._get_collection()
+    delete = getattr(collection, 'delete_many', collection.remove)
+    query = job.get_query()
+    for first_id, last_id in iter_id_batches(job, collection):
+        started = time.time()
+        result = delete({'$and': [query, {'_id': {'$gte': first_id, '$lte': last_id}}]})
+        count = result.deleted_count if hasattr(result, 'deleted_count') else result.get('n', 0)
+        job.update_progress(last_id, count)
+        throttle(job, count, started)
+
+
+def iter_job_documents(job, document):
+    """
+    Documents matching the job query, with progress saved per batch. The
+    fields of the list plan are loaded(columns, `transform_*` requires and
+    list_extra_fields). The admin ordering is dropped: documents are in
+    `_id` order, the order of the checkpoints.
+    """
+    query = job.get_query()
+    mongoadmin = registry.get(job.app_label, job.document_name).mongoadmin
+    only_fields = mongoadmin.get_plan(document).only_fields
+    for first_id, last_id in iter_id_batches(job, document._get_collection()):
+        documents = list(document.objects(__raw__={'$and': [
+            query, {'_id': {'$gte': first_id, '$lte': last_id}}]})
+            .only(*only_fields).order_by('id'))
+        for instance in prefetch_references(documents, job.keys):
+            yield instance
+        job.update_progress(last_id, len(documents))
+
+
+def run_export_job(job, document):
+    """
+    Export documents matching the job query into a gzipped file of
+    get_export_storage(), in `_id` order. The file is written in chunks, a
+    restarted job exports from the beginning.
+    """
+    job.update(set__last_id=None, set__processed=0)
+    job.last_id, job.processed = None, 0
+
+    writer, _ = EXPORT_FORMATS[job.export_format]
+    with tempfile.TemporaryFile() as temp_file:
+        gzip_file = gzip.GzipFile(fileobj=temp_file, mode='wb')
+        for chunk in writer(document, job.keys, iter_job_documents(job, document)):
+            gzip_file.write(chunk)
+        gzip_file.close()
+
+        temp_file.seek(0)
+        name = "{0}_{1}_{2}.{3}.gz".format(job.app_label, job.document_name,
+                                           job.id, job.export_format)
+        name = get_export_storage().save(name, File(temp_file))
+    job.update(set__result_file=name)
+
+
+JOB_HANDLERS = {
+    'delete': run_delete_job,
+    'export': run_export_job,
+}
+
+
+def claim_job():
+    """
+    Claim a pending job, or a running one whose worker stops heartbeat
+    for MONGONAUT_JOB_TIMEOUT seconds. Return None if no job.
+    """
+    now = datetime.datetime.utcnow()
+    stale = now - datetime.timedelta(seconds=settings.MONGONAUT_JOB_TIMEOUT)
+    candidates = MongonautJob.objects(Q(status=JOB_PENDING) |
+                                      Q(status=JOB_RUNNING, updated_date__lt=stale))
+    for job in candidates.order_by('created_date'):
+        claimed = MongonautJob.objects(pk=job.pk, status=job.status,
+                                       updated_date=job.updated_date)\
+            .update_one(set__status=JOB_RUNNING, set__updated_date=now)
+        if claimed:
+            job.reload()
+            return job
+    return None
+
+
+def run_job(job):
+    try:
+        document = get_document(job.app_label, job.document_name)
+        JOB_HANDLERS[job.kind](job, document)
+    except Exception as ex:
+        logger.error("job %s failed.", job.id, exc_info=True)
+        job.update(set__status=JOB_FAILED, set__error=unicode(ex),
+                   set__updated_date=datetime.datetime.utcnow())
+    else:
+        job.update(set__status=JOB_DONE,
+                   set__updated_date=datetime.datetime.utcnow())
+
+
+def run_pending_jobs():
+    """Run jobs until no job is pending. Return the number of jobs run."""
+    count = 0
+    job = claim_job()
+    while job is not None:
+        run_job(job)
+        count += 1
+        job = claim_job()
+    return count
+
+
+def reset_connections():
+    """
+    pymongo clients are not fork-safe, drop the inherited ones in a forked
+    worker, mongoengine reconnects lazily.
+    """
+    for alias in list(connection._connections.keys()):
+        connection.disconnect(alias)
+
+
+def work(interval=5, once=False):
+    """Worker loop, run jobs and wait interval seconds when no job is pending."""
+    while True:
+        count = run_pending_jobs()
+        if once:
+            break
+        if not count:
+            time.sleep(interval)
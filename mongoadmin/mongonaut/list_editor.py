@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+Paged editing of large ListFields, see BaseMongoAdmin.paged_list_fields.
+
+A page of elements is loaded with a `$slice` projection. Elements are
+changed one by one with atomic updates: positional `$set` and `$unset`
+are guarded by the old value of the element, so an edit on a list
+changed meanwhile matches nothing instead of hitting another element.
+"""
+from __future__ import absolute_import
+import json
+
+from bson import json_util
+from bson.son import SON
+from mongoengine.base import BaseDocument
+from mongoengine.fields import EmbeddedDocumentField, ListField
+
+from .export import to_export_value
+
+
+def get_list_field(document_type, field_name):
+    """The ListField field_name of document_type if it is paged, else None."""
+    field = document_type._fields.get(field_name)
+    if not isinstance(field, ListField) or \
+            field_name not in document_type.mongoadmin.paged_list_fields:
+        return None
+    return field
+
+
+def get_id_query(document_type, pk):
+    id_field = document_type._fields[document_type._meta['id_field']]
+    return {'_id': id_field.to_mongo(id_field.to_python(pk))}
+
+
+def get_list_length(document_type, pk, field):
+    """Length of the list, by `$size` on the server."""
+    pipeline = [{'$match': get_id_query(document_type, pk)},
+                {'$project': {'length': {'$size': {'$ifNull': ['$' + field.db_field, []]}}}}]
+    result = document_type._get_collection().aggregate(pipeline)
+    # pymongo 2 returns a dict, pymongo 3 a cursor.
+    result = list(result['result'] if isinstance(result, dict) else result)
+    return result[0]['length'] if result else None
+
+
+def get_list_page(document_type, pk, field, page, page_size):
+    """
+    Elements of a page(from 1) of the list, loaded with `$slice`.
+    @return: (elements, length), elements is a list of
+        {'index': index in list, 'value': display value, 'raw': element in json}.
+        None if no document.
+    """
+    length = get_list_length(document_type, pk, field)
+    if length is None:
+        return None, 0
+    skip = (page - 1) * page_size
+    # exclude the other paged lists, the projection can not include
+    # fields along with `$slice`.
+    projection = dict((document_type._fields[key].db_field, 0)
+                      for key in document_type.mongoadmin.paged_list_fields
+                      if key != field.name and key in document_type._fields)
+    projection[field.db_field] = {'$slice': [skip, page_size]}
+    son = document_type._get_collection().find_one(get_id_query(document_type, pk), projection)
+    elements = []
+    for index, raw in enumerate((son.get(field.db_field) or []) if son else []):
+        elements.append({'index': skip + index,
+                         'value': get_element_value(field.field, raw),
+                         'raw': json_util.dumps(raw)})
+    return elements, length
+
+
+def get_element_value(field, raw):
+    """Display value of a raw element, a dict of fields for embedded documents."""
+    value = field.to_python(raw)
+    if isinstance(value, BaseDocument):
+        return dict((key, to_export_value(getattr(value, key, None)))
+                    for key in value._fields_ordered)
+    return to_export_value(value)
+
+
+def parse_element(field, value):
+    """
+    Element from json posted by the editor, a dict of fields for embedded
+    documents. Raise ValidationError or ValueError if invalid.
+    @return: element in mongo.
+    """
+    value = json.loads(value)
+    if isinstance(field, EmbeddedDocumentField):
+        if not isinstance(value, dict):
+            raise ValueError(u"expect an object of fields.")
+        document_type = field.document_type
+        value = document_type(**dict((key, document_type._fields[key].to_python(item))
+                                     for key, item in value.iteritems()
+                                     if key in document_type._fields))
+    else:
+        value = field.to_python(value)
+    field.validate(value)
+    return field.to_mongo(value)
+
+
+def parse_raw(raw):
+    """
+    Old element posted back by the editor. Keeps the field order of
+    embedded documents, a query matches them by exact order.
+    """
+    return json.loads(raw, object_pairs_hook=lambda pairs: json_util.object_hook(SON(pairs)))
+
+
+def set_element(document_type, pk, field, index, raw, value):
+    """Positional `$set` of the element at index, if it is still raw."""
+    path = u"{0}.{1}".format(field.db_field, int(index))
+    query = get_id_query(document_type, pk)
+    query[path] = raw
+    return document_type.objects(__raw__=query).update_one(__raw__={'$set': {path: value}})
+
+
+def push_element(document_type, pk, field, value):
+    return document_type.objects(__raw__=get_id_query(document_type, pk))\
+        .update_one(__raw__={'$push': {field.db_field: value}})
+
+
+def pull_element(document_type, pk, field, index, raw):
+    """
+    Remove the element at index, if it is still raw. Equal elements at
+    other positions are kept: positional `$unset` leaves a null, then
+    `$pull` removes the nulls(null elements of the list too).
+    """
+    path = u"{0}.{1}".format(field.db_field, int(index))
+    query = get_id_query(document_type, pk)
+    query[path] = raw
+    updated = document_type.objects(__raw__=query).update_one(__raw__={'$unset': {path: 1}})
+    if updated:
+        document_type.objects(__raw__=get_id_query(document_type, pk))\
+            .update_one(__raw__={'$pull': {field.db_field: None}})
+    return updated
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+import multiprocessing
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from mongonaut.jobs import reset_connections, work
+
+
+def work_in_pool(options):
+    work(options['interval'], options['once'])
+
+
+class Command(BaseCommand):
+    help = "Run mongonaut background jobs, e.g. delete or export all documents matching a filter."
+
+    option_list = BaseCommand.option_list + (
+        make_option('--interval', type='float', default=5,
+                    help='Seconds to wait when no job is pending.'),
+        make_option('--once', action='store_true', default=False,
+                    help='Exit when no job is pending.'),
+        make_option('--processes', type='int', default=1,
+                    help='Number of worker processes running jobs in parallel.'),
+    )
+
+    def handle(self, *args, **options):
+        processes = options['processes']
+        if processes <= 1:
+            work(options['interval'], options['once'])
+            return
+
+        options = {'interval': options['interval'], 'once': options['once']}
+        pool = multiprocessing.Pool(processes, initializer=reset_connections)
+        try:
+            pool.map(work_in_pool, [options] * processes)
+        finally:
+            pool.terminate()
@@ -1,4 +1,5 @@
 # -*- coding: utf-8 -*-
+import copy
 import logging
 
 from django.contrib import messages
@@ -11,33 +12,23 @@ from django.utils.functional import cached_property
 from django.utils.decorators import method_decorator
 from django import http
 
+from mongoengine import Document, signals
 from mongoengine.errors import NotUniqueError
-from mongoengine.fields import EmbeddedDocumentField
+from mongoengine.fields import EmbeddedDocumentField, ReferenceField
 
 from .conf import settings
 from .exceptions import NoMongoAdminSpecified
 from .forms.forms import MongoModelForm
 from .forms.form_utils import has_digit, make_key
-from .utils import translate_value, trim_field_key
+from .permissions import get_user_cached, get_permissions
+from .registry import registry
+from .utils import (translate_value, trim_field_key, get_field_path_value,
+                    get_form_key_field, to_reference_id, get_missing_references)
 
 
 logger = logging.getLogger(__name__)
 
 
-class AppStore(object):
-
-    def __init__(self, module):
-        self.models = []
-        for key in module.__dict__.keys():
-            model_candidate = getattr(module, key)
-            if hasattr(model_candidate, 'mongoadmin'):
-                self.add_model(model_candidate)
-
-    def add_model(self, model):
-        model.name = model.__name__
-        self.models.append(model)
-
-
 class MongonautBaseViewMixin(object):
 
     @method_decorator(login_required)
@@ -63,22 +54,7 @@ class MongonautBaseViewMixin(object):
 
     def get_mongoadmins(self):
         """ Returns a list of all mongoadmin implementations for the site """
-        apps = []
-        for app_name in settings.INSTALLED_APPS:
-            mongoadmin = "{0}.mongoadmin".format(app_name)
-            try:
-                module = import_module(mongoadmin)
-            except ImportError as e:
-                if str(e).startswith("No module named"):
-                    continue
-                raise e
-
-            app_store = AppStore(module)
-            apps.append(dict(
-                app_name=app_name,
-                obj=app_store
-            ))
-        return apps
+        return registry.get_apps()
 
 
 class MongonautViewMixin(MongonautBaseViewMixin):
@@ -120,6 +96,11 @@ class MongonautViewMixin(MongonautBaseViewMixin):
         # TODO Allow this to be assigned via url variable
         self.models_name = self.kwargs.get('models_name', 'models')
 
+        self.registry_entry = registry.get(self.app_label, self.document_name)
+        if self.models_name == 'models' and self.registry_entry is not None:
+            self.models = self.registry_entry.models
+            return None
+
         # import the models file
         self.model_name = "{0}.{1}".format(self.app_label, self.models_name)
         try:
@@ -136,17 +117,9 @@ class MongonautViewMixin(MongonautBaseViewMixin):
         if not hasattr(self, "document_name"):
             self.set_mongonaut_base()
 
-        for mongoadmin in self.get_mongoadmins():
-            for model in mongoadmin['obj'].models:
-                # Match the first model.
-                if model.name == self.document_name:
-                    self.mongoadmin = model.mongoadmin
-                    break
-            else:
-                continue
-            break
-        else:
+        if self.registry_entry is None:
             raise NoMongoAdminSpecified("No MongoAdmin for {0}.{1}".format(self.app_label, self.document_name))
+        self.mongoadmin = self.registry_entry.mongoadmin
 
     @cached_property
     def permission_context(self):
@@ -179,30 +152,41 @@ class MongonautNavigationMixin(MongonautBaseViewMixin):
 
     def render_to_response(self, context, **response_kwargs):
         """Override render_to_response for navigation generation.
-        TODO: recode navigation. This version is unsatisfactory.
+        Navigation is cached per user(see mongonaut.permissions), the
+        session is written only when it changes.
         """
-        object_list = self.get_queryset()
-        if not self.request.user.is_superuser:
-            # 清除用户没有权限的应用
-            app_names = [appstore.get('app_name', '') for appstore in object_list]
-            to_be_remove = []
-            for app_name in app_names:
-                if not self.request.user.has_module_perms(app_name):
-                    to_be_remove.append(app_name)
+        navigation = get_user_cached('mongonaut_navigation', self.request.user,
+                                     self.build_navigation)
+        if navigation['forbidden']:
+            # if user has no perms.
+            return HttpResponseForbidden(u"抱歉,你没有权限浏览此内容,请联系管理员.")
+
+        if self.request.session.get('navigation_list') != navigation['navigation_list']:
+            self.request.session['navigation_list'] = navigation['navigation_list']
+
+        return super(MongonautNavigationMixin,
+                     self).render_to_response(context, **response_kwargs)
 
-            if to_be_remove:
-                object_list = [appstore for appstore in object_list\
-                               if appstore.get('app_name', '') not in to_be_remove]
+    def build_navigation(self, user):
+        """TODO: recode navigation. This version is unsatisfactory."""
+        object_list = self.get_queryset()
+        if not user.is_superuser:
+            # same snapshot as permission_context.
+            user_all_perms = get_permissions(self.request)
 
-                if not object_list:
-                    # if user has no perms.
-                    return HttpResponseForbidden(u"抱歉,你没有权限浏览此内容,请联系管理员.")
+            # 清除用户没有权限的应用
+            app_names = set(perms.split('.')[0] for perms in user_all_perms)
+            object_list = [appstore for appstore in object_list
+                           if appstore.get('app_name', '') in app_names]
+            if not object_list:
+                return {'forbidden': True, 'navigation_list': []}
 
             # 清除用户没有权限的集合
-            user_all_perms = self.request.user.get_all_permissions()
             all_perms_set = set()
             for perms in user_all_perms:
                 all_perms_set.add(perms.split('_')[-1])
+            # registry is shared, filter into copies.
+            object_list = [dict(appstore, obj=copy.copy(appstore['obj'])) for appstore in object_list]
             for appstore in object_list:
                 appstore['obj'].models = [model for model in appstore['obj'].models \
                                        if model.mongoadmin.sql_object.lower() in all_perms_set]
@@ -210,10 +194,8 @@ class MongonautNavigationMixin(MongonautBaseViewMixin):
             # 超级管理员不作处理
             pass
 
-        self.request.session['navigation_list'] = self.generate_navigation(object_list)
-
-        return super(MongonautNavigationMixin,
-                     self).render_to_response(context, **response_kwargs)
+        return {'forbidden': False,
+                'navigation_list': self.generate_navigation(object_list)}
 
     def generate_navigation(self, object_list):
         navigation_list = []
@@ -277,6 +259,11 @@ class MongonautFormViewMixin(object):
                 messages.error(self.request, u"Failed to save document")
             else:
                 self.new_document = self.new_document()
+                self.check_references()
+                if self.form.errors:
+                    messages.error(self.request, u"数据有误,请检查!")
+                    return self.form
+
                 for form_key in self.form.cleaned_data.keys():
                     if form_key == 'id' and hasattr(self, 'document'):
                         self.new_document.id = self.document.id
@@ -287,10 +274,15 @@ class MongonautFormViewMixin(object):
                     messages.error(self.request, u"数据有误,请检查!")
                     return self.form
 
+                # Paged lists are not on the form, keep them on a full save.
+                if not is_save:
+                    for key in self.document_type.mongoadmin.paged_list_fields:
+                        setattr(self.new_document, key, getattr(self.document, key, None))
+
                 try:
                     if is_save:
                         self.new_document.save(force_insert=True)
-                    else:
+                    elif not self.update_changed_fields():
                         self.new_document.save()
                 except NotUniqueError:
                     self.form.errors['id'] = u" "
@@ -310,6 +302,103 @@ class MongonautFormViewMixin(object):
 
         return self.form
 
+    def check_references(self):
+        """
+        Check the posted ids of ReferenceFields(in lists and embedded
+        documents too) exist, with one `$in` query per referenced
+        collection. translate_value then sets DBRefs without fetching.
+        """
+        # {document_type: set(ids)}, {(document_type, id): [form_key, ...]}
+        reference_ids, reference_keys = {}, {}
+        for form_key, form_value in self.form.cleaned_data.iteritems():
+            if not form_value:
+                continue
+            field = get_form_key_field(self.document_type, form_key)
+            if not isinstance(field, ReferenceField):
+                continue
+            try:
+                reference_id = to_reference_id(field.document_type, form_value)
+            except Exception:
+                # not an id of the referenced collection.
+                self.form._errors[form_key] = self.form.error_class([u"引用的文档不存在."])
+                continue
+            reference_ids.setdefault(field.document_type, set()).add(reference_id)
+            reference_keys.setdefault((field.document_type, reference_id), []).append(form_key)
+
+        for missing in get_missing_references(reference_ids):
+            for form_key in reference_keys[missing]:
+                self.form._errors[form_key] = self.form.error_class([u"引用的文档不存在."])
+
+    def update_changed_fields(self):
+        """
+        Save an edit as one atomic update_one with `$set`/`$unset` of the
+        fields in form.changed_data, diffed against the loaded self.document.
+        Lists are set as a whole.
+        @return: False if the edit needs a full save: file fields, save
+                 signals registered on the document, or save()/clean()
+                 overridden by it(clean may change fields not on the form).
+        """
+        if getattr(self.document, 'pk', None) is None:
+            return False
+        for method in ('save', 'clean'):
+            if getattr(self.document_type, method).__func__ is not getattr(Document, method).__func__:
+                return False
+        for signal in (signals.pre_save, signals.pre_save_post_validation, signals.post_save):
+            has_receivers = getattr(signal, 'has_receivers_for', None)
+            if has_receivers is not None and has_receivers(self.document_type):
+                return False
+
+        changed_paths = {}
+        for form_key in self.form.changed_data:
+            if isinstance(self.form.fields.get(form_key), FileField):
+                return False
+            fields = self.get_changed_fields(form_key)
+            if fields is None:
+                return False
+            changed_paths[u".".join(field.db_field for field in fields)] = fields
+
+        set_values, unset_values = {}, {}
+        for path, fields in changed_paths.iteritems():
+            value = get_field_path_value(self.new_document, fields)
+            if value == get_field_path_value(self.document, fields):
+                continue
+            if value is None:
+                unset_values[path] = 1
+            else:
+                set_values[path] = fields[-1].to_mongo(value)
+        if not set_values and not unset_values:
+            return True
+
+        self.new_document.validate()
+        update = {}
+        if set_values:
+            update['$set'] = set_values
+        if unset_values:
+            update['$unset'] = unset_values
+        self.document_type.objects(pk=self.document.pk).update_one(__raw__=update)
+        return True
+
+    def get_changed_fields(self, form_key):
+        """
+        Fields from the document to the field of form_key, e.g. `creator_user_name`
+        -> [creator, user_name]. Stops at lists, and at an embedded document
+        missing on self.document(set as a whole). None if not a field.
+        """
+        fields = []
+        document_type, key = self.document_type, form_key
+        while True:
+            current_key, remaining_key_array = trim_field_key(document_type, key)
+            field = document_type._fields.get(current_key)
+            if field is None or field.name == 'id' or field.primary_key:
+                return None
+            fields.append(field)
+            if not (isinstance(field, EmbeddedDocumentField) and remaining_key_array):
+                break
+            if get_field_path_value(self.document, fields) is None:
+                break
+            document_type, key = field.document_type, make_key(remaining_key_array)
+        return fields
+
     def process_document(self, document, form_key, passed_key):
         """
         Given the form_key will evaluate the document and set values correctly for
@@ -1 +1,4 @@
 """ Here because Django requires this as boilerplate. """
+from .permissions import connect_signals
+
+connect_signals()
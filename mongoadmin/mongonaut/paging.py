@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""
+Paging helpers for DocumentListView.
+
+Count strategies: how the list view gets the total of documents, see
+COUNT_STRATEGIES. Paging works without an exact total.
+
+Cursor(keyset) paging: instead of skipping every earlier document, a page
+is fetched with a range query on the ordering keys plus `_id` as tiebreaker,
+so the cost of a page stays the same at any depth. The position is carried
+in the url as an opaque token.
+"""
+from __future__ import absolute_import
+import base64
+import hashlib
+
+from bson import json_util
+from django.core.cache import cache
+
+
+def get_sort_keys(document, ordering):
+    """
+    Build the sort keys used by cursor paging.
+    @param document: Document class.
+    @param ordering: list like ['-signtime', 'uid'].
+    @return: list of (field_name, db_path, direction), always ends with `_id`.
+    """
+    # the primary key field, `id` unless a field is primary_key.
+    id_field = document._meta['id_field']
+    sort_keys = []
+    for key in ordering or ():
+        direction = -1 if key.startswith('-') else 1
+        field_name = key.lstrip('+-')
+        if field_name in ('id', 'pk', id_field):
+            break
+        fields = document._lookup_field(field_name.split('.'))
+        db_path = u".".join(field.db_field for field in fields)
+        sort_keys.append((field_name, db_path, direction))
+    else:
+        direction = 1
+    # `_id` is unique, it makes the order total.
+    sort_keys.append((id_field, '_id', direction))
+    return sort_keys
+
+
+def get_order_by(sort_keys, reverse=False):
+    """Translate sort keys into arguments of queryset.order_by."""
+    order_by = []
+    for field_name, _, direction in sort_keys:
+        if reverse:
+            direction = -direction
+        order_by.append(('-' if direction < 0 else '+') + field_name)
+    return order_by
+
+
+def get_cursor_values(document, sort_keys):
+    """Get the mongo values of the sort keys from a document instance."""
+    values = []
+    for field_name, db_path, _ in sort_keys:
+        if db_path == '_id':
+            values.append(document.pk)
+            continue
+        value = document
+        fields = document._lookup_field(field_name.split('.'))
+        for field in fields:
+            value = getattr(value, field.name, None) if value is not None else None
+        values.append(fields[-1].to_mongo(value) if value is not None else None)
+    return values
+
+
+def get_cursor_query(sort_keys, values, reverse=False):
+    """
+    Raw query of documents after(or before when reverse) the given position.
+    e.g. ordering ['-signtime'] after (t, i):
+        {'$or': [{'$or': [{'signtime': {'$lt': t}}, {'signtime': None}]},
+                 {'signtime': t, '_id': {'$gt': i}}]}
+    Null and missing values sort before all others, and `$gt`/`$lt` never
+    match them: they are queried explicitly.
+    """
+    clauses = []
+    for index, (_, db_path, direction) in enumerate(sort_keys):
+        clause = dict((sort_keys[i][1], values[i]) for i in range(index))
+        value = values[index]
+        if (direction > 0) != reverse:
+            # greater: every value is greater than null.
+            clause[db_path] = {'$gt': value} if value is not None else {'$ne': None}
+        elif value is not None:
+            # less: null is less than every value.
+            clause['$or'] = [{db_path: {'$lt': value}}, {db_path: None}]
+        else:
+            # nothing is less than null.
+            continue
+        clauses.append(clause)
+    return {'$or': clauses}
+
+
+def encode_cursor(values):
+    """Opaque url token for a position."""
+    return base64.urlsafe_b64encode(json_util.dumps(values))
+
+
+def decode_cursor(token, sort_keys):
+    """
+    Reverse of encode_cursor.
+    Raise ValueError if the token is broken or not for these sort keys.
+    """
+    try:
+        values = json_util.loads(base64.urlsafe_b64decode(str(token)))
+    except Exception:
+        raise ValueError("invalid cursor: %s" % token)
+    if not isinstance(values, list) or len(values) != len(sort_keys):
+        raise ValueError("invalid cursor: %s" % token)
+    return values
+
+
+def count_exact(queryset, mongoadmin):
+    """Exact count, a full scan of the matched index."""
+    return queryset.count(), True
+
+
+def count_estimated(queryset, mongoadmin):
+    """Collection metadata count when no filter is active, else exact."""
+    if queryset._query:
+        return count_exact(queryset, mongoadmin)
+    collection = queryset._collection
+    estimated_count = getattr(collection, 'estimated_document_count', collection.count)
+    return estimated_count(), True
+
+
+def count_capped(queryset, mongoadmin):
+    """Stop counting at mongoadmin.count_cap, the result is shown as `cap+`."""
+    cap = mongoadmin.count_cap
+    count = queryset.limit(cap + 1).count(with_limit_and_skip=True)
+    if count > cap:
+        return cap, False
+    return count, True
+
+
+def count_cached(queryset, mongoadmin):
+    """Exact count cached for mongoadmin.count_cache_timeout seconds."""
+    query = json_util.dumps(queryset._query, sort_keys=True)
+    cache_key = "mongonaut_count:{0}:{1}".format(queryset._collection.name,
+                                                 hashlib.md5(query).hexdigest())
+    count = cache.get(cache_key)
+    if count is None:
+        count, _ = count_exact(queryset, mongoadmin)
+        cache.set(cache_key, count, mongoadmin.count_cache_timeout)
+    return count, True
+
+
+COUNT_STRATEGIES = {
+    'exact': count_exact,
+    'estimated': count_estimated,
+    'capped': count_capped,
+    'cached': count_cached,
+}
+
+
+def count_queryset(queryset, mongoadmin):
+    """
+    Count documents with the strategy of mongoadmin.count_strategy, a name
+    in COUNT_STRATEGIES or a callable with the same signature.
+    @return: (count, is_exact), count is a lower bound if not is_exact.
+    """
+    strategy = mongoadmin.count_strategy
+    if not callable(strategy):
+        strategy = COUNT_STRATEGIES[strategy]
+    return strategy(queryset, mongoadmin)
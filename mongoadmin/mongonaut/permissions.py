@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""
+Per-user data cached in django cache: the navigation and the permission
+snapshot of PermissionMongoAdmin.
+
+Keys are versioned: a change of a user row drops the keys of that user,
+a change of groups or permissions bumps the global version, which drops
+the keys of every user. Signals are connected in mongonaut.models.
+"""
+from __future__ import absolute_import
+import time
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group, Permission
+from django.core.cache import cache
+from django.db.models import Q
+from django.db.models.signals import post_save, post_delete, m2m_changed
+
+from .registry import registry
+
+VERSION_KEY = 'mongonaut_permission_version'
+# prefixes of the per-user keys.
+USER_CACHE_PREFIXES = ['mongonaut_navigation', 'mongonaut_permissions']
+# a day, keys are dropped on change anyway.
+USER_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def new_version():
+    # a timestamp, not 1: keys cached before an eviction of the version key
+    # must not match again.
+    return int(time.time() * 1000)
+
+
+def get_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, new_version(), None)
+        version = cache.get(VERSION_KEY) or new_version()
+    return version
+
+
+def bump_version():
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        # not in cache, or evicted.
+        cache.set(VERSION_KEY, new_version(), None)
+
+
+def get_user_cache_key(prefix, user_pk, version=None):
+    return "{0}:{1}:{2}".format(prefix, version or get_version(), user_pk)
+
+
+def get_user_cached(prefix, user, build):
+    """Cached build(user) of the user, build is called on miss."""
+    cache_key = get_user_cache_key(prefix, user.pk)
+    value = cache.get(cache_key)
+    if value is None:
+        value = build(user)
+        cache.set(cache_key, value, USER_CACHE_TIMEOUT)
+    return value
+
+
+def load_permissions(user):
+    """
+    Permissions of user on the sql_objects of all registered admins, in
+    one query. @return: frozenset of "app_label.codename".
+    """
+    from .sites import get_permission_codename
+
+    codenames = set()
+    for entry in registry.entries.values():
+        sql_object = getattr(entry.mongoadmin, 'sql_object', '')
+        if sql_object:
+            codenames.update(get_permission_codename(operation, sql_object)
+                             for operation in ('view', 'change', 'add', 'delete'))
+    if not codenames:
+        return frozenset()
+    permissions = Permission.objects.filter(Q(user=user) | Q(group__user=user),
+                                            codename__in=codenames)\
+        .values_list('content_type__app_label', 'codename').distinct()
+    return frozenset("%s.%s" % (app_label, codename) for app_label, codename in permissions)
+
+
+def get_permissions(request):
+    """Permission snapshot of request.user, loaded once per request."""
+    permissions = getattr(request, '_mongonaut_permissions', None)
+    if permissions is None:
+        user = request.user
+        if not user.is_authenticated() or not user.is_active:
+            permissions = frozenset()
+        else:
+            registry.get_apps()
+            permissions = get_user_cached('mongonaut_permissions', user, load_permissions)
+        request._mongonaut_permissions = permissions
+    return permissions
+
+
+def has_permission(request, permission):
+    """Like user.has_perm("app_label.codename"), on the snapshot."""
+    user = request.user
+    if not user.is_active:
+        return False
+    # Active superusers have all permissions.
+    if user.is_superuser:
+        return True
+    return permission in get_permissions(request)
+
+
+def invalidate_user(user_pk):
+    version = get_version()
+    cache.delete_many([get_user_cache_key(prefix, user_pk, version)
+                       for prefix in USER_CACHE_PREFIXES])
+
+
+def user_changed(sender, instance, **kwargs):
+    invalidate_user(instance.pk)
+
+
+def permissions_changed(sender, **kwargs):
+    bump_version()
+
+
+def user_m2m_changed(sender, instance, action, reverse, **kwargs):
+    """user.groups / user.user_permissions changed."""
+    if not action.startswith('post_'):
+        return
+    if reverse:
+        # e.g. group.user_set.add(user), users unknown.
+        bump_version()
+    else:
+        invalidate_user(instance.pk)
+
+
+def connect_signals():
+    User = get_user_model()
+    post_save.connect(user_changed, sender=User, dispatch_uid='mongonaut_user_saved')
+    post_delete.connect(user_changed, sender=User, dispatch_uid='mongonaut_user_deleted')
+    for model in (Group, Permission):
+        post_save.connect(permissions_changed, sender=model,
+                          dispatch_uid='mongonaut_{0}_saved'.format(model.__name__))
+        post_delete.connect(permissions_changed, sender=model,
+                            dispatch_uid='mongonaut_{0}_deleted'.format(model.__name__))
+    m2m_changed.connect(user_m2m_changed, sender=User.groups.through,
+                        dispatch_uid='mongonaut_user_groups')
+    m2m_changed.connect(user_m2m_changed, sender=User.user_permissions.through,
+                        dispatch_uid='mongonaut_user_permissions')
+    m2m_changed.connect(permissions_changed, sender=Group.permissions.through,
+                        dispatch_uid='mongonaut_group_permissions')
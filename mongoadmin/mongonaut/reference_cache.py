@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""
+Cached (id, label) choices of small lookup collections, for
+AdminReferenceField(cache_choices=True).
+
+Choices are held in an in-process LRU backed by django cache. Keys are
+versioned per referenced collection: mongoengine post_save/post_delete of
+the referenced Document bumps the version, so every process drops its
+copy on the next render. Changes bypassing the signals(queryset.update,
+raw pymongo writes) are seen after MONGONAUT_REFERENCE_CACHE_TIMEOUT.
+"""
+from __future__ import absolute_import
+from collections import OrderedDict
+import threading
+import time
+
+from django.core.cache import cache
+from mongoengine import signals, EmbeddedDocumentField
+from mongoengine.base import ComplexBaseField
+from mongoengine.errors import NotRegistered
+
+from .conf import settings
+
+
+class LRUCache(object):
+    """Thread-safe dict keeping the size most recently used keys."""
+
+    def __init__(self, size):
+        self.size = size
+        self.lock = threading.Lock()
+        self.data = OrderedDict()
+
+    def get(self, key):
+        with self.lock:
+            value = self.data.pop(key, None)
+            if value is not None:
+                self.data[key] = value
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.data.pop(key, None)
+            self.data[key] = value
+            while len(self.data) > self.size:
+                self.data.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.data.pop(key, None)
+
+
+# {collection: (version, choices)}
+LOCAL_CHOICES = LRUCache(settings.MONGONAUT_REFERENCE_CACHE_SIZE)
+
+
+def new_version():
+    # not a counter from 1, an evicted version key must not match old copies.
+    return int(time.time() * 1000)
+
+
+def get_version_key(document_type):
+    return "mongonaut_reference_version:{0}".format(document_type._get_collection_name())
+
+
+def get_version(document_type):
+    version_key = get_version_key(document_type)
+    version = cache.get(version_key)
+    if version is None:
+        cache.add(version_key, new_version(), None)
+        # a new version per call if the cache keeps nothing(DummyCache).
+        version = cache.get(version_key) or new_version()
+    return version
+
+
+def load_choices(document_type):
+    from .forms.form_mixins import get_document_unicode
+
+    return [(unicode(document.pk), get_document_unicode(document))
+            for document in document_type.objects]
+
+
+def get_cached_choices(document_type):
+    """
+    [(id, label), ...] of all documents of document_type, queried once per
+    version. The list is shared, do not change it.
+    """
+    register(document_type)
+    collection = document_type._get_collection_name()
+    version = get_version(document_type)
+    local = LOCAL_CHOICES.get(collection)
+    if local is not None and local[0] == version:
+        return local[1]
+
+    cache_key = "mongonaut_reference_choices:{0}:{1}".format(collection, version)
+    choices = cache.get(cache_key)
+    if choices is None:
+        choices = load_choices(document_type)
+        cache.set(cache_key, choices, settings.MONGONAUT_REFERENCE_CACHE_TIMEOUT)
+    LOCAL_CHOICES.set(collection, (version, choices))
+    return choices
+
+
+def invalidate_choices(sender, **kwargs):
+    """Signal receiver, bump the version of the collection of sender."""
+    version_key = get_version_key(sender)
+    try:
+        cache.incr(version_key)
+    except ValueError:
+        # not in cache, or evicted.
+        cache.set(version_key, new_version(), None)
+    LOCAL_CHOICES.delete(sender._get_collection_name())
+
+
+# Documents whose choices are invalidated by signals.
+REGISTERED_DOCUMENTS = set()
+
+
+def register(document_type):
+    """Invalidate the choices of document_type on change."""
+    if document_type in REGISTERED_DOCUMENTS:
+        return
+    REGISTERED_DOCUMENTS.add(document_type)
+    signals.post_save.connect(invalidate_choices, sender=document_type)
+    signals.post_delete.connect(invalidate_choices, sender=document_type)
+
+
+def is_registered(document_type):
+    return document_type in REGISTERED_DOCUMENTS
+
+
+def register_references(document_type, seen=None):
+    """
+    Register the cache_choices references of document_type and its embedded
+    documents, resolving the ones given by class name.
+    """
+    seen = seen if seen is not None else set()
+    if document_type in seen:
+        return
+    seen.add(document_type)
+    for field in document_type._fields.values():
+        while isinstance(field, ComplexBaseField) and field.field is not None:
+            field = field.field
+        try:
+            if getattr(field, 'cache_choices', False):
+                field.document_type
+            elif isinstance(field, EmbeddedDocumentField):
+                register_references(field.document_type, seen)
+        except NotRegistered:
+            # not imported yet, registered when resolved.
+            pass
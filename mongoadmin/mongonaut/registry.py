@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+Process-wide registry of MongoAdmins.
+
+`<app>.mongoadmin` modules of INSTALLED_APPS are imported once, on first
+use, and every Document with a mongoadmin is indexed by
+(app_label, document_name), so views look up their Document without
+import_module per request. Entries are shared by all requests, do not
+change them.
+"""
+from __future__ import absolute_import
+from collections import namedtuple
+import threading
+
+from django.utils.importlib import import_module
+
+from .conf import settings
+from .reference_cache import register_references
+
+
+class AppStore(object):
+
+    def __init__(self, module):
+        self.models = []
+        for key in module.__dict__.keys():
+            model_candidate = getattr(module, key)
+            if hasattr(model_candidate, 'mongoadmin'):
+                self.add_model(model_candidate)
+
+    def add_model(self, model):
+        model.name = model.__name__
+        self.models.append(model)
+
+
+# document: Document class, models: `<app_label>.models` module.
+RegistryEntry = namedtuple('RegistryEntry', 'app_label document_name document mongoadmin models')
+
+
+def import_app_module(app_name, module_name):
+    """Import `<app_name>.<module_name>`, None if the app has no such module."""
+    try:
+        return import_module("{0}.{1}".format(app_name, module_name))
+    except ImportError as e:
+        if str(e).startswith("No module named"):
+            return None
+        raise e
+
+
+class MongoAdminRegistry(object):
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.apps = None
+        self.entries = {}
+
+    def build(self):
+        """Import the mongoadmin modules and index their Documents, once."""
+        with self.lock:
+            if self.apps is not None:
+                return
+            apps, entries = [], {}
+            for app_name in settings.INSTALLED_APPS:
+                module = import_app_module(app_name, 'mongoadmin')
+                if module is None:
+                    continue
+                app_store = AppStore(module)
+                apps.append(dict(app_name=app_name, obj=app_store))
+
+                models = import_app_module(app_name, 'models')
+                for model in app_store.models:
+                    key = (app_name, model.name)
+                    # Match the first model.
+                    if key in entries:
+                        continue
+                    document = getattr(models, model.name, model)
+                    entries[key] = RegistryEntry(app_name, model.name, document,
+                                                 model.mongoadmin, models)
+                    model.mongoadmin.get_plan(document)
+                    register_references(document)
+            self.entries = entries
+            self.apps = apps
+
+    def get_apps(self):
+        """[{'app_name': ..., 'obj': AppStore}, ...] in INSTALLED_APPS order."""
+        if self.apps is None:
+            self.build()
+        return self.apps
+
+    def get(self, app_label, document_name):
+        """RegistryEntry of the document, None if not registered."""
+        if self.apps is None:
+            self.build()
+        return self.entries.get((app_label, document_name))
+
+
+registry = MongoAdminRegistry()
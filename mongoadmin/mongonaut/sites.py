@@ -1,8 +1,28 @@
 # -*- coding: utf-8 -*-
+from collections import namedtuple
+
 try:
     import floppyforms as forms
 except ImportError:
     from django import forms
+from mongoengine.fields import EmbeddedDocumentField, ListField
+
+from .permissions import has_permission
+
+
+# Column/field plan of a Document, built once per admin by
+# BaseMongoAdmin.get_plan. Views only read it, never change it.
+DocumentPlan = namedtuple('DocumentPlan', [
+    'list_keys',         # columns of list, `id` first, then primary key.
+    'columns',           # templatetags.mongonaut_tags.Column of list_keys.
+    'only_fields',       # fields loaded by list when list_projection.
+    'raw_rows',          # list rows can be rendered from raw BSON.
+    'detail_keys',       # plain fields of detail, `id` first.
+    'detail_list_keys',  # ListFields of detail.
+    'embedded_keys',     # EmbeddedDocumentFields of detail.
+    'operations',        # Document.operations, shown in list.
+    'bulk_edit_keys',    # fields the bulk edit of list can set.
+])
 
 
 class BaseMongoAdmin(object):
@@ -18,10 +38,56 @@ class BaseMongoAdmin(object):
     # Exclude the fields to be displayed as columns.
     exclude_fields = []
 
+    # Only load the fields list needs: columns, ordering and the fields
+    # declared by Document.transform_requires.
+    list_projection = True
+    # Extra fields loaded in list, for `transform_*` methods that need them.
+    list_extra_fields = []
+    # Render list rows from raw BSON(queryset.as_pymongo()) instead of
+    # Documents. Falls back to Documents when a column has a `transform_*` method.
+    list_raw_rows = False
+
     # shows on edit page while not on add page.
     show_in_edit = []
 
     ordering = None
+
+    # Paging of list view.
+    # 'offset': skip/limit by page number.
+    # 'cursor': keyset paging on ordering + _id, constant cost at any depth.
+    paging = 'offset'
+    # In cursor paging, jumping to a page number deeper than this offset is refused.
+    max_page_offset = 10000
+
+    # How list view counts documents, see mongonaut.paging.COUNT_STRATEGIES.
+    # 'exact', 'estimated'(metadata count when no filter is active),
+    # 'capped'(stop at count_cap, shown as "10,000+"), 'cached'(exact count
+    # cached for count_cache_timeout seconds), or a staticmethod with the
+    # signature of the functions in COUNT_STRATEGIES.
+    count_strategy = 'exact'
+    count_cap = 10000
+    count_cache_timeout = 60
+
+    # "Delete all matching filter" runs in the background worker, see
+    # mongonaut.jobs. Deletes batch_size documents per batch, and at most
+    # rate documents per second(None for no limit).
+    bulk_delete_batch_size = 1000
+    bulk_delete_rate = 5000
+
+    # Documents fetched per round trip when exporting csv/jsonl.
+    export_batch_size = 500
+
+    # ListFields edited page by page on the edit page(loaded with $slice,
+    # changed with positional $set, $push and $pull) instead of one form
+    # field per element. They are not on the add form.
+    paged_list_fields = []
+    list_field_page_size = 50
+
+    # Fields the bulk edit of list can set on many documents with one
+    # update. If empty, all plain fields except primary key, unique and
+    # file fields.
+    bulk_edit_fields = []
+
     form = forms.ModelForm
 
     ############# inherit from django-admin but not achive #############
@@ -55,6 +121,89 @@ class BaseMongoAdmin(object):
     save_on_top = False
     ############# inherit from django-admin but not achive #############
 
+    def get_plan(self, document):
+        """
+        DocumentPlan of document, built on the first call and cached on
+        the admin. Building twice in threads gives equal plans, no lock.
+        """
+        plans = self.__dict__.setdefault('_plans', {})
+        plan = plans.get(document)
+        if plan is None:
+            plan = plans[document] = self.build_plan(document)
+        return plan
+
+    def build_plan(self, document):
+        from .templatetags.mongonaut_tags import get_columns
+
+        # 完全不在List,Add,Edit中显示, 在model中用作另外的用途.
+        fake_list = getattr(document, 'fake_list', ())
+
+        # if empty, all fields except exclude_fields.
+        list_fields = self.list_fields or [key for key in document._fields_ordered
+                                           if key not in self.exclude_fields]
+        list_keys = ['id']
+        for key in list_fields:
+            if key == 'id' or key not in document._fields or key in fake_list:
+                continue
+            # TODO - Figure out why this EmbeddedDocumentField and ListField breaks this view
+            field = document._fields[key]
+            if isinstance(field, (EmbeddedDocumentField, ListField)):
+                continue
+            # Primary_key first.
+            if field.primary_key:
+                list_keys.insert(1, key)
+            else:
+                list_keys.append(key)
+
+        # columns, ordering, fields needed by `transform_*` methods
+        # (Document.transform_requires) and list_extra_fields.
+        only_fields = set(list_keys)
+        ordering = self.ordering or document._meta.get('ordering') or ()
+        only_fields.update(key.lstrip('+-').split('.')[0] for key in ordering)
+        # e.g. transform_requires = {'nickname': ('uid', )}
+        transform_requires = getattr(document, 'transform_requires', {})
+        for key in list_keys:
+            only_fields.update(transform_requires.get(key, ()))
+        only_fields.update(self.list_extra_fields)
+        only_fields = tuple(key for key in only_fields if key in document._fields and
+                            key not in ('id', 'pk'))
+
+        # a `transform_*` method of a column needs the Document.
+        raw_rows = self.list_raw_rows and not any(
+            callable(getattr(document, 'transform_{key}'.format(key=key), None))
+            for key in list_keys)
+
+        detail_keys, detail_list_keys, embedded_keys = ['id'], [], []
+        for key in document._fields_ordered:
+            if key == 'id':
+                continue
+            field = document._fields[key]
+            if isinstance(field, EmbeddedDocumentField):
+                embedded_keys.append(key)
+            elif isinstance(field, ListField):
+                detail_list_keys.append(key)
+            else:
+                detail_keys.append(key)
+
+        # one value for many documents: no primary key, unique or file fields.
+        bulk_edit_keys = tuple(
+            key for key in detail_keys
+            if key != 'id' and key not in fake_list and
+            (not self.bulk_edit_fields or key in self.bulk_edit_fields) and
+            not document._fields[key].primary_key and
+            not getattr(document._fields[key], 'unique', False) and
+            not callable(getattr(document._fields[key], 'save_to_mongo', None)))
+
+        return DocumentPlan(list_keys=tuple(list_keys),
+                            columns=get_columns(document, list_keys),
+                            only_fields=only_fields,
+                            raw_rows=raw_rows,
+                            detail_keys=tuple(detail_keys),
+                            detail_list_keys=tuple(detail_list_keys),
+                            embedded_keys=tuple(embedded_keys),
+                            operations=getattr(document, 'operations', {}),
+                            bulk_edit_keys=bulk_edit_keys)
+
     def has_view_permission(self, request):
         """
         Returns True if the given HttpRequest has permission to view
@@ -81,7 +230,8 @@ def get_permission_codename(operation, object_name):
 
 class PermissionMongoAdmin(BaseMongoAdmin):
     '''
-    Add django admin permission into MongoAdmin
+    Add django admin permission into MongoAdmin.
+    Permissions are checked on the snapshot of mongonaut.permissions.
     '''
 
     # bound sql object name which offers permission control.
@@ -96,20 +246,20 @@ class PermissionMongoAdmin(BaseMongoAdmin):
 
     def has_view_permission(self, request, app_label):
         codename = get_permission_codename("view", self.sql_object)
-        return request.user.has_perm("%s.%s" % (app_label, codename))
+        return has_permission(request, "%s.%s" % (app_label, codename))
 
     def has_edit_permission(self, request, app_label):
         codename = get_permission_codename("change", self.sql_object)
-        return request.user.has_perm("%s.%s" % (app_label, codename))
+        return has_permission(request, "%s.%s" % (app_label, codename))
 
     def has_add_permission(self, request, app_label):
         # Active superusers have all permissions.
         codename = get_permission_codename("add", self.sql_object)
-        return request.user.has_perm("%s.%s" % (app_label, codename))
+        return has_permission(request, "%s.%s" % (app_label, codename))
 
     def has_delete_permission(self, request, app_label):
         codename = get_permission_codename("delete", self.sql_object)
-        return request.user.has_perm("%s.%s" % (app_label, codename))
+        return has_permission(request, "%s.%s" % (app_label, codename))
 
 
 class AutoPermissionMongoAdmin(PermissionMongoAdmin):
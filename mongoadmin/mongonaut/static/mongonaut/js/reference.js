@@ -0,0 +1,71 @@
+/* Search as you type for ReferenceField selects(MongoReferenceWidget).
+   Needs `reference_url`, the url of the document_reference view. */
+(function($){
+    var MORE = '__more__';
+
+    function load(select, query, after){
+        var params = {field: select.attr('name'), q: query};
+        if(after){
+            params.after = after;
+        }
+        $.getJSON(reference_url, params, function(data){
+            if(!after){
+                // keep the blank and selected choices.
+                select.find('option').filter(function(){
+                    return this.value && !this.selected;
+                }).remove();
+            }
+            select.find('option[value=' + MORE + ']').remove();
+            $.each(data.results, function(i, result){
+                if(select.find('option[value="' + result.id + '"]').length == 0){
+                    select.append($('<option>').val(result.id).text(result.text));
+                }
+            });
+            if(data.next){
+                select.append($('<option>').val(MORE).text('更多...').data('next', data.next));
+            }
+        });
+    }
+
+    function search_box(select){
+        var box = select.prev('.reference-search');
+        if(box.length == 0){
+            box = $('<input type="text" class="reference-search" placeholder="搜索">');
+            select.before(box);
+        }
+        return box;
+    }
+
+    $(function(){
+        $('select.reference-autocomplete').each(function(){
+            search_box($(this));
+        });
+    });
+    // list elements added by list_add.js.
+    $(document).on('focus', 'select.reference-autocomplete', function(){
+        var select = $(this);
+        search_box(select);
+        if(!select.data('loaded')){
+            select.data('loaded', true);
+            load(select, '', null);
+        }
+    });
+    var timer = null;
+    $(document).on('keyup', '.reference-search', function(){
+        var box = $(this);
+        clearTimeout(timer);
+        timer = setTimeout(function(){
+            var select = box.next('select.reference-autocomplete');
+            select.data('loaded', true);
+            load(select, box.val(), null);
+        }, 300);
+    });
+    $(document).on('change', 'select.reference-autocomplete', function(){
+        var select = $(this);
+        var more = select.find('option:selected[value=' + MORE + ']');
+        if(more.length){
+            select.val('');
+            load(select, select.prev('.reference-search').val(), more.data('next'));
+        }
+    });
+})(jQuery);
@@ -0,0 +1,67 @@
+// 分页编辑列表, 每次只加载一页, 修改单个元素.
+function list_editor_load(editor, page){
+    $.getJSON(editor.data('url'), {page: page}, function(data){
+        editor.data('page', data.page);
+        editor.find('.list-editor-length').text('共 ' + data.length + ' 项');
+        editor.find('.list-editor-page').text(data.page + ' / ' + data.total_pages);
+        editor.find('.list-editor-previous').toggle(data.page > 1);
+        editor.find('.list-editor-next').toggle(data.page < data.total_pages);
+        var tbody = editor.find('tbody').empty();
+        $.each(data.elements, function(i, element){
+            var row = $('<tr>');
+            row.data('element', element);
+            row.append($('<td>').text(element.index));
+            row.append($('<td>').text(JSON.stringify(element.value)));
+            row.append($('<td>').append(
+                '<a href="#" class="list-editor-set">修改</a> <a href="#" class="list-editor-pull">删除</a>'));
+            tbody.append(row);
+        });
+    });
+}
+
+function list_editor_post(editor, data){
+    data.csrfmiddlewaretoken = $('input[name=csrfmiddlewaretoken]').first().val();
+    $.post(editor.data('url'), data, function(response){
+        if(!response.status){
+            alert(response.message);
+        }
+        list_editor_load(editor, editor.data('page'));
+    }, 'json');
+}
+
+$('.list-editor').each(function(){
+    var editor = $(this);
+    list_editor_load(editor, 1);
+    editor.on('click', '.list-editor-previous', function(){
+        list_editor_load(editor, editor.data('page') - 1);
+        return false;
+    });
+    editor.on('click', '.list-editor-next', function(){
+        list_editor_load(editor, editor.data('page') + 1);
+        return false;
+    });
+    editor.on('click', '.list-editor-push', function(){
+        var value = prompt('新元素(JSON):', '""');
+        if(value !== null){
+            list_editor_post(editor, {action: 'push', value: value});
+        }
+        return false;
+    });
+    editor.on('click', '.list-editor-set', function(){
+        var element = $(this).closest('tr').data('element');
+        var value = prompt('修改元素(JSON):', JSON.stringify(element.value));
+        if(value !== null){
+            list_editor_post(editor, {action: 'set', index: element.index,
+                                      raw: element.raw, value: value});
+        }
+        return false;
+    });
+    editor.on('click', '.list-editor-pull', function(){
+        var element = $(this).closest('tr').data('element');
+        if(confirm('确定删除?')){
+            list_editor_post(editor, {action: 'pull', index: element.index,
+                                      raw: element.raw});
+        }
+        return false;
+    });
+});
@@ -1,4 +1,6 @@
 # -*- coding: utf-8 -*-
+from collections import namedtuple
+
 from django import template
 from django.core.urlresolvers import reverse
 from django.utils.safestring import mark_safe
@@ -9,7 +11,7 @@ from mongoengine.fields import (URLField, ListField, ReferenceField,
 from pytz import utc
 
 from mongonaut.conf import settings
-from mongonaut.fields import AdminImageURLField, AdminURLField
+from mongonaut.fields import AdminImageURLField, AdminURLField, AdminReferenceField
 from mongonaut.forms.widgets import absolute_media_path
 
 register = template.Library()
@@ -88,6 +90,7 @@ def process_none(value, field):
 FIELD_TO_VALUE = {
     ObjectIdField: process_none,
     ReferenceField: process_document,
+    AdminReferenceField: process_document,
     DateTimeField: process_time,
     AdminImageURLField: process_image_url,
     AdminURLField: process_url,
@@ -96,6 +99,15 @@ FIELD_TO_VALUE = {
 }
 
 
+def scale_string(value):
+    """Shorten long string."""
+    if isinstance(value, basestring) and len(value) > 20:
+        shorten_value = value[0:12] + "..."
+        return mark_safe("""<p title="{0}">{1}</p>""".format(value.encode('utf-8'),
+                                                             shorten_value.encode('utf-8')))
+    return value
+
+
 @register.simple_tag()
 def get_document_value(document, key):
     """Get document value shown on Website.
@@ -119,12 +131,48 @@ def get_document_value(document, key):
         return process_method(value, field)
 
     # scale string
-    if isinstance(value, basestring) and len(value) > 20:
-        shorten_value = value[0:12] + "..."
-        return mark_safe("""<p title="{0}">{1}</p>""".format(value.encode('utf-8'),
-                                                             shorten_value.encode('utf-8')))
+    return scale_string(value)
 
-    return value
+
+def get_value_renderer(document_type, key):
+    """
+    Compiled get_document_value for a column: the transform method, field
+    and FIELD_TO_VALUE lookups are done once.
+    @return: callable(document) -> value shown on Website.
+    """
+    transform_name = 'transform_{key}'.format(key=key)
+    if callable(getattr(document_type, transform_name, None)):
+        def render(document):
+            return getattr(document, transform_name)(getattr(document, key, ''))
+        return render
+
+    field = document_type._fields.get(key, None)
+    process_method = FIELD_TO_VALUE.get(type(field), None)
+    if callable(process_method):
+        def render(document):
+            return process_method(getattr(document, key, ''), field)
+        return render
+
+    def render(document):
+        return scale_string(getattr(document, key, ''))
+    return render
+
+
+# Column of the list table, render is None for `id`.
+Column = namedtuple('Column', 'key label render')
+
+
+def get_columns(document_type, keys):
+    """Columns of the list table, labels and renderers resolved once."""
+    return tuple(Column(key, get_document_key(document_type, key),
+                        None if key == 'id' else get_value_renderer(document_type, key))
+                 for key in keys)
+
+
+def render_rows(plan, documents):
+    """[(document, [cell, ...]), ...], cells of the columns except `id`."""
+    renders = [column.render for column in plan if column.render is not None]
+    return [(document, [render(document) for render in renders]) for document in documents]
 
 
 @register.simple_tag()
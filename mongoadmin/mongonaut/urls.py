@@ -20,6 +20,31 @@ urlpatterns = patterns('',
         view=views.DocumentAddFormView.as_view(),
         name="document_detail_add_form"
     ),
+    url(
+        regex=r'^(?P<app_label>[_\-\w]+)/(?P<document_name>[_\-\w]+)/export/(?P<export_format>[\w]+)/$',
+        view=views.DocumentExportView.as_view(),
+        name="document_export"
+    ),
+    url(
+        regex=r'^(?P<app_label>[_\-\w]+)/(?P<document_name>[_\-\w]+)/reference/$',
+        view=views.DocumentReferenceView.as_view(),
+        name="document_reference"
+    ),
+    url(
+        regex=r'^(?P<app_label>[_\-\w]+)/(?P<document_name>[_\-\w]+)/bulk_edit/$',
+        view=views.DocumentBulkEditView.as_view(),
+        name="document_bulk_edit"
+    ),
+    url(
+        regex=r'^(?P<app_label>[_\-\w]+)/(?P<document_name>[_\-\w]+)/jobs/(?P<job_id>[\w]+)/$',
+        view=views.DocumentJobView.as_view(),
+        name="document_job"
+    ),
+    url(
+        regex=r'^(?P<app_label>[_\-\w]+)/(?P<document_name>[_\-\w]+)/jobs/(?P<job_id>[\w]+)/download/$',
+        view=views.DocumentJobDownloadView.as_view(),
+        name="document_job_download"
+    ),
     url(
         regex=r'^(?P<app_label>[_\-\w]+)/(?P<document_name>[_\-\w]+)/(?P<id>[\w]+)/$',
         view=views.DocumentDetailView.as_view(),
@@ -30,6 +55,11 @@ urlpatterns = patterns('',
         view=views.DocumentEditFormView.as_view(),
         name="document_detail_edit_form"
     ),
+    url(
+        regex=r'^(?P<app_label>[_\-\w]+)/(?P<document_name>[_\-\w]+)/(?P<id>[\w]+)/list/(?P<field_name>[\w]+)/$',
+        view=views.DocumentListFieldView.as_view(),
+        name="document_list_field"
+    ),
     url(
         regex=r'^(?P<app_label>[_\-\w]+)/(?P<document_name>[_\-\w]+)/(?P<id>[\w]+)/delete/$',
         view=views.DocumentDeleteView.as_view(),
@@ -13,12 +13,14 @@ from django.db.models import Q, Model
 from django.utils import importlib
 from django.utils.safestring import mark_safe
 from django.utils.timezone import localtime
-from django.utils.encoding import force_text
+from django.utils.encoding import force_text, smart_text
 
+from bson.dbref import DBRef
 from mongoengine import Document
 from mongoengine.base import ObjectIdField, ValidationError
-from mongoengine.fields import ReferenceField, StringField
-from mongoengine.django.shortcuts import get_document_or_404
+from mongoengine.fields import (ReferenceField, StringField, ListField,
+                                EmbeddedDocumentField, IntField, LongField,
+                                FloatField, BooleanField, DateTimeField)
 
 from .templatetags.mongonaut_tags import get_document_key
 
@@ -47,25 +49,228 @@ def is_valid_object_id(value):
         return False
 
 
+def get_document_ids(document_type, values):
+    """Ids of document_type from posted values, converted by the pk field. Invalid ones are skipped."""
+    id_field = document_type._fields[document_type._meta['id_field']]
+    document_ids = []
+    for value in values:
+        try:
+            document_id = id_field.to_python(value)
+            id_field.validate(document_id)
+        except Exception:
+            # not an id of document_type.
+            continue
+        document_ids.append(document_id)
+    return document_ids
+
+
 def translate_value(document_field, form_value):
     """
     Given a document_field and a form_value this will translate the value
-    to the correct result for mongo to use.
+    to the correct result for mongo to use. A ReferenceField value becomes
+    a DBRef without fetching the document, check the ids exist first with
+    get_missing_references.
     """
     value = form_value
     if isinstance(document_field, ReferenceField):
-        value = get_document_or_404(document_field.document_type.objects,
-                                    id=form_value) if form_value else None
+        value = get_reference_value(document_field.document_type, form_value) \
+            if form_value else None
+    return value
+
+
+def get_reference_value(document_type, form_value):
+    """DBRef of a posted id of document_type."""
+    return DBRef(document_type._get_collection_name(), to_reference_id(document_type, form_value))
+
+
+def to_reference_id(document_type, form_value):
+    """Id of document_type from a posted value, raise if it is not a valid id."""
+    id_field = document_type._fields[document_type._meta['id_field']]
+    reference_id = id_field.to_python(form_value)
+    id_field.validate(reference_id)
+    return id_field.to_mongo(reference_id)
+
+
+def get_missing_references(reference_ids):
+    """
+    Ids of reference_ids which are not in their collection, with one `$in`
+    query per referenced collection.
+    @param reference_ids: {document_type: set(ids)}
+    @return: set of (document_type, id)
+    """
+    missing = set()
+    for document_type, ids in reference_ids.iteritems():
+        ids = list(ids)
+        found = set(son['_id'] for son in document_type._get_collection()
+                    .find({'_id': {'$in': ids}}, {'_id': 1}))
+        missing.update((document_type, reference_id) for reference_id in ids
+                       if reference_id not in found)
+    return missing
+
+
+def get_reference_id(value):
+    """Id of a not dereferenced value of ReferenceField, None if dereferenced."""
+    if isinstance(value, DBRef):
+        return value.id
+    if value is None or isinstance(value, Document):
+        return None
     return value
 
 
+def prefetch_references(documents, keys=None):
+    """
+    Dereference ReferenceField and ListField(ReferenceField) values of the
+    documents(and their embedded documents) with one `$in` query per
+    referenced collection. Results are put back into document._data, so
+    template tags get the referenced documents without round trips.
+    @param documents: iterable of Document.
+    @param keys: only prefetch these fields of the top level documents.
+    @return: list of documents.
+    """
+    documents = list(documents)
+    # (document, key, document_type, is_list)
+    targets = []
+    # {document_type: set(ids)}
+    reference_ids = {}
+    stack = [(document, keys) for document in documents]
+    while stack:
+        document, only_keys = stack.pop()
+        for key, field in document._fields.items():
+            if only_keys is not None and key not in only_keys:
+                continue
+            value = document._data.get(key)
+            if not value:
+                continue
+            if isinstance(field, EmbeddedDocumentField):
+                stack.append((value, None))
+                continue
+            if isinstance(field, ReferenceField):
+                values, is_list = [value], False
+                document_type = field.document_type
+            elif isinstance(field, ListField) and isinstance(field.field, ReferenceField):
+                values, is_list = value, True
+                document_type = field.field.document_type
+            else:
+                continue
+            ids = [get_reference_id(item) for item in values]
+            ids = [item for item in ids if item is not None]
+            if ids:
+                reference_ids.setdefault(document_type, set()).update(ids)
+                targets.append((document, key, document_type, is_list))
+
+    references = {}
+    for document_type, ids in reference_ids.items():
+        references[document_type] = document_type.objects.in_bulk(list(ids))
+
+    for document, key, document_type, is_list in targets:
+        found = references[document_type]
+        value = document._data[key]
+        if is_list:
+            document._data[key] = [found.get(get_reference_id(item), item) for item in value]
+        else:
+            document._data[key] = found.get(get_reference_id(value), value)
+    return documents
+
+
+# Fields whose to_python does nothing with a value decoded from BSON.
+RAW_TO_PYTHON = set(field_class.to_python.__func__ for field_class in
+                    (StringField, IntField, LongField, FloatField, BooleanField,
+                     DateTimeField, ObjectIdField))
+
+
+class RawRow(object):
+    """
+    A light list row of a son from queryset.as_pymongo(), used instead of a
+    Document. Only the loaded fields are decoded, and field.to_python is
+    only called when it changes the BSON value(e.g. ReferenceField,
+    AdminIntSelectField).
+    Supports what list rendering and cursor paging need: id, field
+    attributes, _fields, _lookup_field and _data(for prefetch_references).
+    """
+
+    def __init__(self, document_type, son):
+        self._document_type = document_type
+        self._fields = document_type._fields
+        self._lookup_field = document_type._lookup_field
+        self._id_field = document_type._meta['id_field']
+        self._data = {}
+        for key, field in self._fields.items():
+            if field.db_field not in son:
+                continue
+            value = son[field.db_field]
+            if value is not None and type(field).to_python.__func__ not in RAW_TO_PYTHON:
+                value = field.to_python(value)
+            self._data[key] = value
+
+    @property
+    def id(self):
+        return self._data.get(self._id_field)
+
+    pk = id
+
+    def __getattr__(self, key):
+        if key.startswith('_') or key not in self._fields:
+            raise AttributeError(key)
+        return self._data.get(key)
+
+
+class FieldKeyResolver(object):
+    """
+    Trie of the field names of a Document class split on `_`, finds the
+    field at the start of a form key without probing attributes.
+    """
+
+    def __init__(self, document_type):
+        self.root = {}
+        for field_name in document_type._fields:
+            node = self.root
+            for segment in field_name.split("_"):
+                node = node.setdefault(segment, {})
+            # None key marks the end of a field name.
+            node[None] = field_name
+
+    def split(self, field_key):
+        """
+        Longest field name at the start of field_key.
+        return (key, left_over_array), key is None if no field matches.
+        """
+        segments = field_key.split("_")
+        node, key, end = self.root, None, 0
+        for index, segment in enumerate(segments):
+            node = node.get(segment)
+            if node is None:
+                break
+            if None in node:
+                key, end = node[None], index + 1
+        return key, segments[end:]
+
+
+FIELD_KEY_RESOLVERS = {}
+
+
+def get_field_key_resolver(document):
+    """FieldKeyResolver of the class of document, None if it has no fields."""
+    document_type = document if isinstance(document, type) else type(document)
+    resolver = FIELD_KEY_RESOLVERS.get(document_type)
+    if resolver is None and hasattr(document_type, '_fields'):
+        resolver = FIELD_KEY_RESOLVERS[document_type] = FieldKeyResolver(document_type)
+    return resolver
+
+
 def trim_field_key(document, field_key):
     """
-    Returns the smallest delimited version of field_key that
-    is an attribute on document.
+    Returns the longest delimited version of field_key that
+    is a field on document.
 
     return (key, left_over_array)
     """
+    resolver = get_field_key_resolver(document)
+    if resolver is not None:
+        current_key, left_over_key_values = resolver.split(field_key)
+        if current_key is not None:
+            return current_key, left_over_key_values
+
+    # Not a field, probe attributes.
     trimming = True
     left_over_key_values = []
     current_key = field_key
@@ -81,6 +286,43 @@ def trim_field_key(document, field_key):
     return current_key, left_over_key_values
 
 
+def get_form_key_field(document_type, form_key):
+    """
+    Field of a form key through embedded documents and lists, e.g.
+    `comments_author_0` of Post -> Comment.author. None if not a field.
+    """
+    key = form_key
+    while key:
+        current_key, remaining_key_array = trim_field_key(document_type, key)
+        field = document_type._fields.get(current_key) if current_key else None
+        if field is None:
+            return None
+        if isinstance(field, ListField):
+            field = field.field
+            # list index is the last part of the key.
+            if remaining_key_array and remaining_key_array[-1].isdigit():
+                remaining_key_array = remaining_key_array[:-1]
+        if not remaining_key_array:
+            return field
+        if not isinstance(field, EmbeddedDocumentField):
+            return None
+        document_type, key = field.document_type, u"_".join(remaining_key_array)
+    return None
+
+
+def get_field_path_value(document, fields):
+    """
+    Value of document at the path of fields, None if a parent is missing.
+    Read from _data, references are not dereferenced.
+    """
+    value = document
+    for field in fields:
+        if value is None:
+            return None
+        value = value._data.get(field.name)
+    return value
+
+
 def load_class(path):
     """
     Load class from path.
@@ -147,6 +389,20 @@ def log_change(request, mongo_object, app_label, message):
         )
 
 
+def log_bulk_change(request, document_type, app_label, count, message):
+    """Log one summary entry for a change of count documents of document_type."""
+    if request.user.is_authenticated():
+        mysql_object = get_sql_object(document_type, app_label)
+        LogEntry.objects.log_action(
+            user_id=request.user.pk,
+            content_type_id=ContentType.objects.get_for_model(mysql_object).pk,
+            object_id=None,
+            object_repr=u"{0} x {1}".format(document_type.__name__, count),
+            action_flag=CHANGE,
+            change_message=message
+        )
+
+
 def get_from_change_data(form):
     """Get change data from form.
     @param form, Django.Form or subclass.
@@ -182,6 +438,23 @@ def log_deletion(request, mongo_object, app_label):
         )
 
 
+def log_deletions(request, mongo_objects, app_label):
+    """
+    Log that objects will be deleted, with one insert for all objects.
+    Batch version of log_deletion.
+    """
+    if request.user.is_authenticated() and mongo_objects:
+        mysql_object = get_sql_object(mongo_objects[0], app_label)
+        content_type_id = ContentType.objects.get_for_model(mysql_object).pk
+        LogEntry.objects.bulk_create([
+            LogEntry(user_id=request.user.pk,
+                     content_type_id=content_type_id,
+                     object_id=smart_text(mongo_object.id),
+                     object_repr=force_text(mongo_object)[:200],
+                     action_flag=DELETION)
+            for mongo_object in mongo_objects])
+
+
 def currentframe():
     """Return the frame object for the caller's stack frame."""
     try:
@@ -1,22 +1,39 @@
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import
+import json
 
+from bson import json_util
+from django import http
 from django.contrib import messages
 from django.core.urlresolvers import reverse
 from django.forms import Form
+from django.http import (HttpResponse, HttpResponseForbidden, HttpResponseRedirect,
+                         StreamingHttpResponse)
 from django.views.generic.edit import DeletionMixin, FormView
-from django.views.generic import TemplateView
+from django.views.generic import TemplateView, View
 from django.core.exceptions import ValidationError as django_ValidationError
 
 from mongoengine.django.shortcuts import get_document_or_404
-from mongoengine.fields import EmbeddedDocumentField, ListField
 from mongoengine.errors import ValidationError as mongo_ValidationError
+from mongoengine.fields import ReferenceField
+from mongoengine.queryset import Q
 
 from .conf import settings
+from .export import EXPORT_FORMATS, iter_documents
 from .forms.forms import MongoModelForm
+from .forms.form_mixins import get_document_unicode
+from .jobs import MongonautJob, create_job, get_export_storage, JOB_PENDING, JOB_RUNNING, JOB_DONE
+from . import list_editor
+from . import reference_cache
 from .mixins import MongonautFormViewMixin, MongonautViewMixin, MongonautNavigationMixin
-from .utils import (log_addition, log_change, log_deletion, get_first_line_doc,
-                    is_valid_object_id, get_from_change_data)
+from .templatetags.mongonaut_tags import get_document_key, render_rows
+from .paging import (get_sort_keys, get_order_by, get_cursor_values,
+                     get_cursor_query, encode_cursor, decode_cursor, count_queryset)
+from .utils import (log_addition, log_change, log_deletion, log_deletions, get_first_line_doc,
+                    is_valid_object_id, get_from_change_data, prefetch_references,
+                    get_form_key_field, translate_value, to_reference_id,
+                    get_missing_references, log_bulk_change, get_document_ids,
+                    RawRow)
 
 import logging
 logger = logging.getLogger(__name__)
@@ -55,28 +72,74 @@ class DocumentListView(MongonautViewMixin, TemplateView):
         if hasattr(self, "queryset") and self.queryset is not None:
             return self.queryset
 
+        queryset = self.get_filtered_queryset()
+        self.obj_count, self.count_is_exact = count_queryset(queryset, self.mongoadmin)
+
+        use_raw_rows = self.use_raw_rows()
+        if use_raw_rows:
+            queryset = queryset.as_pymongo()
+
+        # paging
+        if self.mongoadmin.paging == 'cursor':
+            queryset = self.process_cursor_paging(queryset)
+        else:
+            queryset = self.process_paging(queryset)
+
+        if use_raw_rows:
+            queryset = self.to_rows(queryset)
+
+        self.queryset = queryset
+
+        return queryset
+
+    def get_filtered_queryset(self):
+        """Search or filter, and ordering. No paging."""
         self.document = getattr(self.models, self.document_name)
         # search. move this to get_queryset
         self.search_str = self.request.GET.get('q')
         self.search_type = self.request.GET.get('select')
         if getattr(self.mongoadmin, "filterobject", None):
-            queryset = self.get_filterset(self.request.GET)
-            # ordering
-            if self.mongoadmin.ordering:
-                queryset = queryset.qs.order_by(*self.mongoadmin.ordering)
+            queryset = self.get_filterset(self.request.GET).qs
         else:
             queryset = self.get_qset(self.search_type, self.search_str)
-            # ordering
-            if self.mongoadmin.ordering:
-                queryset = queryset.order_by(*self.mongoadmin.ordering)
 
-        # paging
-        queryset = self.process_paging(queryset)
-
-        self.queryset = queryset
+        # ordering
+        if self.mongoadmin.ordering:
+            queryset = queryset.order_by(*self.mongoadmin.ordering)
 
+        # projection, only load the fields list needs.
+        if self.mongoadmin.list_projection:
+            queryset = queryset.only(*self.get_list_only_fields())
         return queryset
 
+    def get_plan(self):
+        """Column/field plan of the document, see BaseMongoAdmin.get_plan."""
+        return self.mongoadmin.get_plan(self.document)
+
+    def get_list_keys(self):
+        """Keys of the columns shown in list."""
+        return self.get_plan().list_keys
+
+    def use_raw_rows(self):
+        """
+        Render list rows from raw BSON instead of Documents, unless a
+        `transform_*` method of a column needs the Document.
+        """
+        return self.get_plan().raw_rows
+
+    def to_rows(self, documents):
+        """List of documents, sons of as_pymongo() are wrapped into RawRow."""
+        return [RawRow(self.document, son) if isinstance(son, dict) else son
+                for son in documents]
+
+    def get_list_only_fields(self):
+        """
+        Fields loaded from mongo for list: columns, ordering, fields
+        needed by `transform_*` methods(Document.transform_requires) and
+        mongoadmin.list_extra_fields.
+        """
+        return self.get_plan().only_fields
+
     def get_filterset(self, data):
         _data = {}
         self.search_data = None
@@ -89,7 +152,6 @@ class DocumentListView(MongonautViewMixin, TemplateView):
         if _data:
             self.search_data = _data
         queryset = self.mongoadmin.filterobject(data=self.search_data)
-        self.obj_count = queryset.count()
         return queryset
 
     def get_qset(self, select, q):
@@ -124,7 +186,6 @@ class DocumentListView(MongonautViewMixin, TemplateView):
                 params[search_key] = q
                 queryset = queryset.filter(**params)
 
-        self.obj_count = queryset.count()
         return queryset
 
     def process_paging(self, queryset):
@@ -138,53 +199,163 @@ class DocumentListView(MongonautViewMixin, TemplateView):
         except ValueError:
             self.page = 1
 
-        self.total_pages = self.obj_count / self.documents_per_page +\
-                        (1 if self.obj_count % self.documents_per_page else 0)
+        self.total_pages = self.get_total_pages()
 
         if self.page < 1:
             self.page = 1
 
-        if self.page > self.total_pages:
+        if self.total_pages is not None and self.page > self.total_pages:
             self.page = self.total_pages
 
         start = (self.page - 1) * self.documents_per_page
         end = self.page * self.documents_per_page
 
-        queryset = queryset[start:end] if self.obj_count else queryset
+        if self.total_pages is not None:
+            queryset = queryset[start:end] if self.obj_count else queryset
+            self.has_next_page = self.page < self.total_pages
+        else:
+            # Without exact total, one more document tells whether there is a next page.
+            documents = list(queryset[start:end + 1])
+            self.has_next_page = len(documents) > self.documents_per_page
+            queryset = documents[:self.documents_per_page]
 
         self.start_index = start
 
         return queryset
 
+    def process_cursor_paging(self, queryset):
+        """
+        Keyset paging, see mongonaut.paging.
+        Url params:
+            after/before: cursor token of the next/previous page.
+            page: page number for display, or a jump when no cursor is given.
+        """
+        ordering = self.mongoadmin.ordering or self.document._meta.get('ordering')
+        sort_keys = get_sort_keys(self.document, ordering)
+
+        try:
+            self.page = int(self.request.GET.get('page', '1'))
+        except ValueError:
+            self.page = 1
+        if self.page < 1:
+            self.page = 1
+
+        self.total_pages = self.get_total_pages()
+
+        after = self.request.GET.get('after')
+        before = self.request.GET.get('before')
+        reverse = False
+        offset = 0
+        try:
+            if before:
+                values = decode_cursor(before, sort_keys)
+                queryset = queryset.filter(__raw__=get_cursor_query(sort_keys, values, reverse=True))
+                reverse = True
+            elif after:
+                values = decode_cursor(after, sort_keys)
+                queryset = queryset.filter(__raw__=get_cursor_query(sort_keys, values))
+            else:
+                offset = (self.page - 1) * self.documents_per_page
+        except ValueError:
+            messages.add_message(self.request, messages.ERROR, u'invalid page.')
+            self.page = 1
+            after = None
+
+        # Deep skip is what cursor paging avoids, refuse it.
+        if offset > self.mongoadmin.max_page_offset:
+            messages.add_message(self.request, messages.ERROR,
+                                 u'page {0} is too deep, please use previous/next page '
+                                 'or search.'.format(self.page))
+            self.page = 1
+            offset = 0
+
+        # One more document tells whether there is a next page.
+        queryset = queryset.order_by(*get_order_by(sort_keys, reverse))
+        documents = self.to_rows(queryset.skip(offset).limit(self.documents_per_page + 1))
+        has_more = len(documents) > self.documents_per_page
+        documents = documents[:self.documents_per_page]
+        if reverse:
+            documents.reverse()
+            if not has_more:
+                self.page = 1
+
+        self.next_cursor = None
+        self.previous_cursor = None
+        if documents:
+            if has_more or reverse:
+                self.next_cursor = encode_cursor(get_cursor_values(documents[-1], sort_keys))
+            if (reverse and has_more) or (not reverse and (after or offset)):
+                self.previous_cursor = encode_cursor(get_cursor_values(documents[0], sort_keys))
+
+        self.start_index = (self.page - 1) * self.documents_per_page
+
+        return documents
+
+    def get_total_pages(self):
+        """None if the count is not exact."""
+        if not self.count_is_exact:
+            return None
+        return self.obj_count / self.documents_per_page +\
+            (1 if self.obj_count % self.documents_per_page else 0)
+
+    def get_page_query(self, page, **cursor):
+        """Query string of a page, keeps search and filter params."""
+        query = self.request.GET.copy()
+        for key in ('page', 'after', 'before'):
+            query.pop(key, None)
+        query['page'] = page
+        for key, value in cursor.items():
+            query[key] = value
+        return query.urlencode()
+
     def get_context_data(self, **kwargs):
         context = super(DocumentListView, self).get_context_data(**kwargs)
 
-        context['object_list'] = self.get_queryset()
+        context['object_list'] = prefetch_references(self.get_queryset(),
+                                                     self.get_list_keys())
 
         context['document'] = self.document
         context['app_label'] = self.app_label
         context['document_name'] = self.document_name
         context['document_doc'] = get_first_line_doc(self.document.__doc__)
         context['total_count'] = self.obj_count
+        context['total_count_display'] = u"{0:,}{1}".format(self.obj_count,
+                                                           '' if self.count_is_exact else '+')
 
         # pagination bits
         context['page'] = self.page
         context['documents_per_page'] = self.documents_per_page
 
-        if self.page > 1:
-            previous_page_number = self.page - 1
+        if self.mongoadmin.paging == 'cursor':
+            previous_page_number = self.page - 1 if self.previous_cursor else None
+            next_page_number = self.page + 1 if self.next_cursor else None
+            previous_page_query = self.get_page_query(previous_page_number,
+                                                      before=self.previous_cursor)\
+                if self.previous_cursor else None
+            next_page_query = self.get_page_query(next_page_number,
+                                                  after=self.next_cursor)\
+                if self.next_cursor else None
         else:
-            previous_page_number = None
+            if self.page > 1:
+                previous_page_number = self.page - 1
+            else:
+                previous_page_number = None
 
-        if self.page < self.total_pages:
-            next_page_number = self.page + 1
-        else:
-            next_page_number = None
+            if self.has_next_page:
+                next_page_number = self.page + 1
+            else:
+                next_page_number = None
+            previous_page_query = self.get_page_query(previous_page_number)\
+                if previous_page_number is not None else None
+            next_page_query = self.get_page_query(next_page_number)\
+                if next_page_number is not None else None
 
         context['previous_page_number'] = previous_page_number
         context['has_previous_page'] = previous_page_number is not None
+        context['previous_page_query'] = previous_page_query
         context['next_page_number'] = next_page_number
         context['has_next_page'] = next_page_number is not None
+        context['next_page_query'] = next_page_query
         context['total_pages'] = self.total_pages
         context['start_index'] = self.start_index
 
@@ -193,40 +364,20 @@ class DocumentListView(MongonautViewMixin, TemplateView):
         context['BOOSTRAP_SELECT_JS'] = settings.MONGONAUT_BOOSTRAP_SELECT_JS
 
         # Part of upcoming list view form functionality
-        if self.queryset.count():
-            context['keys'] = ['id', ]
-
-            # if empty, add all fileds.
-            if not self.mongoadmin.list_fields:
-                self.mongoadmin.list_fields = list(self.document._fields_ordered)
-                # remove field that should not showed in list.
-                for field in self.mongoadmin.exclude_fields:
-                    self.mongoadmin.list_fields.remove(field)
-
-            # 完全不在List,Add,Edit中显示, 在model中用作另外的用途.
-            fake_list = getattr(self.document, 'fake_list', ())
-
-            # Show those items for which we've got list_fields on the mongoadmin
-            for key in [x for x in self.mongoadmin.list_fields if x != 'id' and
-                        x in self.document._fields.keys() and
-                        x not in fake_list]:
-
-                # TODO - Figure out why this EmbeddedDocumentField and ListField breaks this view
-                # Note - This is the challenge part, right? :)
-                field = self.document._fields[key]
-                if isinstance(field, EmbeddedDocumentField):
-                    continue
-                if isinstance(field, ListField):
-                    continue
-                # Primary_key first.
-                if field.primary_key:
-                    context['keys'].insert(1, key)
-                else:
-                    context['keys'].append(key)
+        if self.obj_count:
+            plan = self.get_plan()
+            context['keys'] = plan.list_keys
+            context['columns'] = plan.columns
+            context['rows'] = render_rows(plan.columns, context['object_list'])
 
             # Add some additional operations.
-            operations = getattr(self.document, 'operations', {})
-            context['operations'] = operations
+            context['operations'] = plan.operations
+
+        # Background jobs in progress, and exports of the user.
+        context['jobs'] = MongonautJob.objects(
+            Q(status__in=[JOB_PENDING, JOB_RUNNING]) |
+            Q(kind='export', user_id=self.request.user.pk),
+            app_label=self.app_label, document_name=self.document_name)[:10]
 
         if getattr(self.mongoadmin, 'filterobject', None):
             context['search_data'] = self.search_data
@@ -242,19 +393,441 @@ class DocumentListView(MongonautViewMixin, TemplateView):
 
         return context
 
-    def get_all_mongo_ids(self):
-        self.query = self.get_queryset()
-        mongo_ids = [unicode(x.id) for x in self.query]
-        return mongo_ids
+    def post(self, request, *args, **kwargs):
+        """Delete the selected documents, limited to the filtered list."""
+        if request.POST.get('action') == 'delete_filtered':
+            return self.delete_filtered(request)
+
+        queryset = self.get_filtered_queryset()
+        mongo_ids = get_document_ids(self.document, request.POST.getlist('mongo_id'))
+        if mongo_ids:
+            queryset = queryset.all_fields().filter(pk__in=mongo_ids)
+            documents = list(queryset)
+            log_deletions(request, documents, self.app_label)
+            # One remove for all, unless delete rules or signals are registered.
+            queryset.delete()
+            messages.add_message(request, messages.INFO,
+                                 u'{0}条数据已被删除.'.format(len(documents)))
+        return HttpResponseRedirect(request.get_full_path())
+
+    def is_filter_active(self, queryset):
+        """
+        queryset of get_filtered_queryset is narrower than the collection.
+        Decided from the effective query: invalid filter values give none(),
+        no-op filters leave the query of document.objects(`_cls` included).
+        """
+        if getattr(queryset, '_none', False):
+            return False
+        return queryset._query != self.document.objects._query
+
+    def delete_filtered(self, request):
+        """Delete all documents matching the active filter or search in background."""
+        queryset = self.get_filtered_queryset()
+        if not self.is_filter_active(queryset):
+            # Never purge a whole collection by accident.
+            messages.add_message(request, messages.ERROR, u'请先筛选或搜索需要删除的数据.')
+        else:
+            obj_count, count_is_exact = count_queryset(queryset, self.mongoadmin)
+            create_job('delete', self.app_label, self.document_name, queryset,
+                       user=request.user,
+                       total=obj_count if count_is_exact else None,
+                       batch_size=self.mongoadmin.bulk_delete_batch_size,
+                       rate=self.mongoadmin.bulk_delete_rate)
+            messages.add_message(request, messages.INFO, u'删除任务已提交, 将在后台执行.')
+        return HttpResponseRedirect(request.get_full_path())
+
+
+class DocumentBulkEditView(DocumentListView):
+    """ :args: <app_label> <document_name>
+
+    Set the chosen fields of many documents with one update: the documents
+    selected in list(mongo_id posted by list, kept by the forms of this page)
+    or all matching the active filter(?scope=filtered). `fields` are the
+    chosen fields, only they are on the form. Note: save signals of
+    mongoengine are not sent.
+    """
+    template_name = "mongonaut/document_bulk_edit.html"
+    permission = 'has_edit_permission'
+
+    def get_permission(self):
+        return self.permission
+
+    def get_bulk_queryset(self):
+        """Documents to change, None if nothing selected or no filter is active."""
+        queryset = self.get_filtered_queryset()
+        if self.request.GET.get('scope') == 'filtered':
+            # Never change a whole collection by accident.
+            return queryset if self.is_filter_active(queryset) else None
+        # posted, hundreds of ids do not fit in an url.
+        mongo_ids = get_document_ids(self.document, self.request.POST.getlist('mongo_id'))
+        return queryset.filter(pk__in=mongo_ids) if mongo_ids else None
+
+    def get_bulk_fields(self):
+        """Chosen fields, in order of the document."""
+        params = self.request.POST if self.request.method == 'POST' else self.request.GET
+        chosen = params.getlist('fields')
+        return [key for key in self.get_plan().bulk_edit_keys if key in chosen]
+
+    def get_bulk_form(self, data=None):
+        form = MongoModelForm(model=self.document, form_post_data=data).get_form()
+        for key in form.fields.keys():
+            if key not in self.bulk_fields:
+                del form.fields[key]
+        return form
+
+    def get_list_url(self):
+        """List with the active filter."""
+        params = self.request.GET.copy()
+        for key in ('scope', 'fields'):
+            params.pop(key, None)
+        return u"{0}?{1}".format(reverse('document_list', kwargs={'app_label': self.app_label,
+                                                                'document_name': self.document_name}),
+                                 params.urlencode())
+
+    def get(self, request, *args, **kwargs):
+        self.queryset = self.get_bulk_queryset()
+        if self.queryset is None:
+            messages.add_message(request, messages.ERROR, u'请先选择或筛选需要修改的数据.')
+            return HttpResponseRedirect(self.get_list_url())
+        self.bulk_fields = self.get_bulk_fields()
+        self.form = self.get_bulk_form() if self.bulk_fields else None
+        return self.render_to_response(self.get_context_data(**kwargs))
+
+    def post(self, request, *args, **kwargs):
+        if 'action' not in request.POST:
+            # the selection of list, or the field chooser.
+            return self.get(request, *args, **kwargs)
+        self.queryset = self.get_bulk_queryset()
+        self.bulk_fields = self.get_bulk_fields()
+        if self.queryset is None or not self.bulk_fields:
+            return HttpResponseRedirect(self.get_list_url())
+        self.form = self.get_bulk_form(request.POST)
+        self.form.is_bound = True
+        if self.form.is_valid():
+            update = self.get_update()
+            if not self.form.errors:
+                count = self.queryset.update(__raw__=update)
+                if reference_cache.is_registered(self.document):
+                    reference_cache.invalidate_choices(self.document)
+                changes = u",,".join(u"{0}:{1}".format(key, self.form.cleaned_data.get(key))
+                                     for key in self.bulk_fields)
+                log_bulk_change(request, self.document, self.app_label, count,
+                                u"{0} {1}".format(json_util.dumps(self.queryset._query), changes))
+                messages.add_message(request, messages.INFO, u'{0}条数据已被修改.'.format(count))
+                return HttpResponseRedirect(self.get_list_url())
+        messages.add_message(request, messages.ERROR, u"数据有误,请检查!")
+        return self.render_to_response(self.get_context_data(**kwargs))
+
+    def get_update(self):
+        """
+        `$set`/`$unset` of the chosen fields, the value is validated once with
+        the `validate_<key>` hook and the field. Errors are put on the form.
+        """
+        instance = self.document()
+        set_values, unset_values, reference_ids = {}, {}, {}
+        for key in self.bulk_fields:
+            field = self.document._fields[key]
+            form_value = self.form.cleaned_data.get(key)
+            try:
+                if isinstance(field, ReferenceField) and form_value:
+                    reference_ids[key] = (field.document_type,
+                                          to_reference_id(field.document_type, form_value))
+                value = translate_value(field, form_value)
+                # 自定义数据转换
+                validate_method = getattr(instance, 'validate_{key}'.format(key=key), None)
+                if callable(validate_method):
+                    value = validate_method(value)
+                if value is None:
+                    if field.required:
+                        raise django_ValidationError(u"This field is required.")
+                    unset_values[field.db_field] = 1
+                else:
+                    field.validate(value)
+                    set_values[field.db_field] = field.to_mongo(value)
+            except django_ValidationError as ex:
+                self.form._errors[key] = self.form.error_class(ex.messages)
+            except mongo_ValidationError as ex:
+                self.form._errors[key] = self.form.error_class([ex.message])
+            except Exception:
+                # not an id of the referenced collection.
+                self.form._errors[key] = self.form.error_class([u"引用的文档不存在."])
+
+        references = {}
+        for document_type, reference_id in reference_ids.itervalues():
+            references.setdefault(document_type, set()).add(reference_id)
+        missing = get_missing_references(references)
+        for key, reference_id in reference_ids.iteritems():
+            if reference_id in missing:
+                self.form._errors[key] = self.form.error_class([u"引用的文档不存在."])
+
+        update = {}
+        if set_values:
+            update['$set'] = set_values
+        if unset_values:
+            update['$unset'] = unset_values
+        return update
+
+    def get_context_data(self, **kwargs):
+        # not the context of list, no rows are loaded.
+        context = super(DocumentListView, self).get_context_data(**kwargs)
+        context['app_label'] = self.app_label
+        context['document_name'] = self.document_name
+        context['document_doc'] = get_first_line_doc(self.document.__doc__)
+        context['JQUERY_VALIDATE_JS'] = settings.MONGONAUT_JQUERY_VALIDATE_JS
+        context['bulk_edit_keys'] = [(key, get_document_key(self.document, key), key in self.bulk_fields)
+                                     for key in self.get_plan().bulk_edit_keys]
+        # the selection is posted again by the field chooser and the form,
+        # the filter is kept in the url.
+        context['selection_params'] = [('mongo_id', value)
+                                       for value in self.request.POST.getlist('mongo_id')]
+        context['hidden_params'] = context['selection_params'] + [('fields', key)
+                                                                  for key in self.bulk_fields]
+        obj_count, count_is_exact = count_queryset(self.queryset, self.mongoadmin)
+        context['total_count_display'] = u"{0:,}{1}".format(obj_count, '' if count_is_exact else '+')
+        context['form'] = self.form
+        context['form_action'] = self.request.get_full_path()
+        context['list_url'] = self.get_list_url()
+        return context
+
+
+class DocumentJobView(MongonautViewMixin, View):
+    """ :args: <app_label> <document_name> <job_id>
+
+    Progress of a background job, in json.
+    """
+    permission = 'has_view_permission'
+
+    def get(self, request, *args, **kwargs):
+        job_id = self.kwargs.get('job_id')
+        if not is_valid_object_id(job_id):
+            raise http.Http404('No job {0}.'.format(job_id))
+        job = get_document_or_404(MongonautJob.objects, pk=job_id,
+                                  app_label=self.app_label,
+                                  document_name=self.document_name)
+        return HttpResponse(json.dumps(job.to_json()),
+                            status=200,
+                            content_type="application/json")
+
+
+class DocumentJobDownloadView(MongonautViewMixin, View):
+    """ :args: <app_label> <document_name> <job_id>
+
+    Gzipped file of a done export job, for its user with view permission.
+    """
+    permission = 'has_view_permission'
+
+    def get(self, request, *args, **kwargs):
+        job_id = self.kwargs.get('job_id')
+        if not is_valid_object_id(job_id):
+            raise http.Http404('No job {0}.'.format(job_id))
+        job = get_document_or_404(MongonautJob.objects, pk=job_id, kind='export',
+                                  status=JOB_DONE,
+                                  app_label=self.app_label,
+                                  document_name=self.document_name)
+        # exports of other users are not shown, nor downloaded.
+        if not job.result_file or (job.user_id != request.user.pk and
+                                   not request.user.is_superuser):
+            raise http.Http404('No export {0}.'.format(job_id))
+
+        storage = get_export_storage()
+        if not storage.exists(job.result_file):
+            raise http.Http404('No export {0}.'.format(job_id))
+        response = StreamingHttpResponse(iter_file(storage.open(job.result_file)),
+                                         content_type='application/gzip')
+        response['Content-Disposition'] = 'attachment; filename="{0}.{1}.gz"'.format(
+            self.document_name, job.export_format)
+        return response
+
+
+def iter_file(export_file):
+    """Chunks of export_file, closed at the end."""
+    try:
+        for chunk in export_file.chunks():
+            yield chunk
+    finally:
+        export_file.close()
+
+
+class DocumentListFieldView(MongonautViewMixin, View):
+    """ :args: <app_label> <document_name> <id> <field_name>
+
+    Paged editor of a ListField in mongoadmin.paged_list_fields, in json.
+    GET ?page=: a page of elements.
+    POST action=set(index, raw, value), push(value) or pull(index, raw).
+    """
+    permission = 'has_view_permission'
+
+    def get_permission(self):
+        if self.request.method == 'POST':
+            return 'has_edit_permission'
+        return self.permission
+
+    def get_list_field(self):
+        self.document_type = getattr(self.models, self.document_name)
+        self.ident = self.kwargs.get('id')
+        field = list_editor.get_list_field(self.document_type, self.kwargs.get('field_name'))
+        if field is None:
+            raise http.Http404('No paged list {0}.'.format(self.kwargs.get('field_name')))
+        return field
+
+    def get(self, request, *args, **kwargs):
+        field = self.get_list_field()
+        try:
+            page = max(int(request.GET.get('page', 1)), 1)
+        except ValueError:
+            page = 1
+        page_size = self.mongoadmin.list_field_page_size
+        elements, length = list_editor.get_list_page(self.document_type, self.ident,
+                                                     field, page, page_size)
+        if elements is None:
+            raise http.Http404('No document {0}.'.format(self.ident))
+        response = {'page': page,
+                    'total_pages': max((length - 1) // page_size + 1, 1),
+                    'length': length,
+                    'elements': elements}
+        return HttpResponse(json.dumps(response),
+                            status=200,
+                            content_type="application/json")
+
+    def post(self, request, *args, **kwargs):
+        field = self.get_list_field()
+        action = request.POST.get('action')
+        response = {'status': False, 'message': ''}
+        try:
+            if action == 'set':
+                updated = list_editor.set_element(
+                    self.document_type, self.ident, field, request.POST['index'],
+                    list_editor.parse_raw(request.POST['raw']),
+                    list_editor.parse_element(field.field, request.POST['value']))
+            elif action == 'push':
+                updated = list_editor.push_element(
+                    self.document_type, self.ident, field,
+                    list_editor.parse_element(field.field, request.POST['value']))
+            elif action == 'pull':
+                updated = list_editor.pull_element(
+                    self.document_type, self.ident, field, request.POST['index'],
+                    list_editor.parse_raw(request.POST['raw']))
+            else:
+                raise ValueError(u"unknown action {0}.".format(action))
+        except (KeyError, ValueError, mongo_ValidationError) as ex:
+            response['message'] = u"数据有误: {0}".format(ex)
+        else:
+            if updated:
+                response['status'] = True
+                document = self.document_type.objects(pk=self.ident).only('id').first()
+                log_change(request, document, self.app_label,
+                           u"{0}:{1}".format(field.name, action))
+            else:
+                response['message'] = u"列表已被修改, 请刷新后重试."
+        return HttpResponse(json.dumps(response),
+                            status=200,
+                            content_type="application/json")
+
+
+class DocumentReferenceView(MongonautViewMixin, View):
+    """ :args: <app_label> <document_name>
+
+    Choices of a ReferenceField select, in json.
+    GET field=<form key>, q=<prefix>, after=<cursor>.
+    The referenced Document declares the field searched and shown, e.g.
+    reference_display_field = 'user_name', which should be indexed; without
+    it the first page of the collection is returned.
+    """
+    page_size = 20
+
+    def permission_passes(self, *args, **kwargs):
+        """Choices are shown on add and edit forms only: add or edit permission."""
+        self.set_mongoadmin()
+        if not (self.check_permission('has_add_permission') or
+                self.check_permission('has_edit_permission')):
+            return HttpResponseForbidden(
+                u"you have no add or edit permission, please contact adminstrator.")
+
+    def get(self, request, *args, **kwargs):
+        document_type = getattr(self.models, self.document_name)
+        field = get_form_key_field(document_type, request.GET.get('field', ''))
+        if not isinstance(field, ReferenceField):
+            raise http.Http404('No reference field {0}.'.format(request.GET.get('field')))
+        reference_type = field.document_type
+
+        display_field = getattr(reference_type, 'reference_display_field', None)
+        queryset = reference_type.objects
+        if display_field:
+            # anchored and case sensitive, so the index is used.
+            prefix = request.GET.get('q', '')
+            if prefix:
+                queryset = queryset(**{display_field + '__startswith': prefix})
+            queryset = queryset.only(display_field)
+        sort_keys = get_sort_keys(reference_type, [display_field] if display_field else [])
+        queryset = queryset.order_by(*get_order_by(sort_keys))
+        if request.GET.get('after'):
+            try:
+                values = decode_cursor(request.GET['after'], sort_keys)
+            except ValueError:
+                raise http.Http404('Invalid cursor.')
+            queryset = queryset(__raw__=get_cursor_query(sort_keys, values))
+
+        documents = list(queryset.limit(self.page_size + 1))
+        has_next = len(documents) > self.page_size
+        documents = documents[:self.page_size]
+        results = [{'id': unicode(document.pk),
+                    'text': unicode(getattr(document, display_field)) if display_field
+                            else get_document_unicode(document)}
+                   for document in documents]
+        response = {'results': results,
+                    'next': encode_cursor(get_cursor_values(documents[-1], sort_keys))
+                            if has_next else None}
+        return HttpResponse(json.dumps(response),
+                            status=200,
+                            content_type="application/json")
+
+
+class DocumentExportView(DocumentListView):
+    """ :args: <app_label> <document_name> <export_format>
+
+    Stream all documents of the filtered list as csv or jsonl.
+    """
+
+    def get(self, request, *args, **kwargs):
+        export_format = self.kwargs.get('export_format')
+        if export_format not in EXPORT_FORMATS:
+            raise http.Http404('No export format {0}.'.format(export_format))
+        writer, content_type = EXPORT_FORMATS[export_format]
+
+        batch_size = self.mongoadmin.export_batch_size
+        # Server side cursor, documents are not cached by queryset.
+        queryset = self.get_filtered_queryset().no_cache().batch_size(batch_size)
+        keys = self.get_list_keys()
+        documents = iter_documents(queryset, keys, batch_size)
+
+        response = StreamingHttpResponse(writer(self.document, keys, documents),
+                                         content_type=content_type)
+        response['Content-Disposition'] = 'attachment; filename="{0}.{1}"'.format(
+            self.document_name, export_format)
+        return response
+
+    def get_permission(self):
+        return self.permission
 
     def post(self, request, *args, **kwargs):
-        mongo_ids = self.get_all_mongo_ids()
-        for form_mongo_id in request.POST.getlist('mongo_id'):
-            for mongo_id in mongo_ids:
-                if form_mongo_id == mongo_id:
-                    self.document.objects.get(pk=mongo_id).delete()
-        context = self.get_context_data()
-        return self.render_to_response(context)
+        """Export in background, for result sets too large to stream in a request."""
+        export_format = self.kwargs.get('export_format')
+        if export_format not in EXPORT_FORMATS:
+            raise http.Http404('No export format {0}.'.format(export_format))
+
+        queryset = self.get_filtered_queryset()
+        obj_count, count_is_exact = count_queryset(queryset, self.mongoadmin)
+        create_job('export', self.app_label, self.document_name, queryset,
+                   user=request.user,
+                   total=obj_count if count_is_exact else None,
+                   batch_size=self.mongoadmin.export_batch_size,
+                   export_format=export_format,
+                   keys=self.get_list_keys())
+        messages.add_message(request, messages.INFO, u'导出任务已提交, 完成后可在列表页下载.')
+        return HttpResponseRedirect(u"{0}?{1}".format(
+            reverse('document_list', kwargs={'app_label': self.app_label,
+                                             'document_name': self.document_name}),
+            request.GET.urlencode()))
 
 
 class DocumentDetailView(MongonautViewMixin, TemplateView):
@@ -267,33 +840,25 @@ class DocumentDetailView(MongonautViewMixin, TemplateView):
         self.document_type = getattr(self.models, self.document_name)
         self.ident = self.kwargs.get('id')
         self.document = get_document_or_404(self.document_type.objects, pk=self.ident)
+        prefetch_references([self.document])
 
         context['document'] = self.document
         context['app_label'] = self.app_label
         context['document_name'] = self.document_name
         context['document_doc'] = get_first_line_doc(self.document.__doc__)
-        context['keys'] = ['id', ]
+        plan = self.mongoadmin.get_plan(self.document_type)
+        context['keys'] = plan.detail_keys
+        context['list_fields'] = plan.detail_list_keys
         context['embedded_documents'] = []
-        context['list_fields'] = []
-        for key in  self.document._fields_ordered:
-            if 'id' == key:
-                continue
-            # TODO - Figure out why this EmbeddedDocumentField and ListField breaks this view
-            # Note - This is the challenge part, right? :)
-            if isinstance(self.document._fields[key], EmbeddedDocumentField):
-                # 处理内嵌文档
-                embedded_field = self.document[key]
-                if embedded_field:
-                    doc = embedded_field.__doc__
-                    embedded_dict = dict(field=embedded_field,
-                                         name=doc.split('\n')[0] if doc else key,
-                                         keys=embedded_field._fields.keys())
-                    context['embedded_documents'].append(embedded_dict)
-                continue
-            if isinstance(self.document._fields[key], ListField):
-                context['list_fields'].append(key)
-                continue
-            context['keys'].append(key)
+        for key in plan.embedded_keys:
+            # 处理内嵌文档
+            embedded_field = self.document[key]
+            if embedded_field:
+                doc = embedded_field.__doc__
+                embedded_dict = dict(field=embedded_field,
+                                     name=doc.split('\n')[0] if doc else key,
+                                     keys=embedded_field._fields.keys())
+                context['embedded_documents'].append(embedded_dict)
         return context
 
 
@@ -327,6 +892,14 @@ class DocumentEditFormView(MongonautViewMixin, MongonautFormViewMixin, FormView)
         context['app_label'] = self.app_label
         context['document_name'] = self.document_name
         context['document_doc'] = get_first_line_doc(self.document.__doc__)
+        context['paged_list_fields'] = [
+            {'key': key,
+             'label': get_document_key(self.document_type, key),
+             'url': reverse('document_list_field', kwargs={'app_label': self.app_label,
+                                                           'document_name': self.document_name,
+                                                           'id': self.kwargs.get('id'),
+                                                           'field_name': key})}
+            for key in self.mongoadmin.paged_list_fields]
         context['form_action'] = reverse('document_detail_edit_form', args=[self.kwargs.get('app_label'),
                                                                             self.kwargs.get('document_name'),
                                                                             self.kwargs.get('id')])
@@ -336,7 +909,7 @@ class DocumentEditFormView(MongonautViewMixin, MongonautFormViewMixin, FormView)
     def get_form(self, Form):
         self.document_type = getattr(self.models, self.document_name)
         self.ident = self.kwargs.get('id')
-        self.document = get_document_or_404(self.document_type.objects, pk=self.ident)
+        self.document = self.get_document()
 
         if self.request.method == 'POST':
             self.form = self.process_post_form(u'修改已被保存.', is_save=False)
@@ -344,6 +917,13 @@ class DocumentEditFormView(MongonautViewMixin, MongonautFormViewMixin, FormView)
             self.form = MongoModelForm(model=self.document_type, instance=self.document).get_form()
         return self.form
 
+    def get_document(self):
+        """Paged lists are loaded by the list editor, not on GET."""
+        queryset = self.document_type.objects
+        if self.request.method != 'POST' and self.mongoadmin.paged_list_fields:
+            queryset = queryset.exclude(*self.mongoadmin.paged_list_fields)
+        return get_document_or_404(queryset, pk=self.ident)
+
 
 class DocumentAddFormView(MongonautViewMixin, MongonautFormViewMixin, FormView):
     """ :args: <app_label> <document_name> <id> """
@@ -410,10 +990,10 @@ class DocumentDeleteView(DeletionMixin, MongonautViewMixin, TemplateView):
 
 from django.views.decorators.http import require_GET
 from django.http.response import HttpResponse
-from django.utils.importlib import import_module
-from django import http
 import json
 
+from .registry import registry
+
 
 @require_GET
 def DocumentOperation(request, app_label, document_name, id, func_name):
@@ -429,14 +1009,11 @@ def DocumentOperation(request, app_label, document_name, id, func_name):
 
     response = {'status': False,
                 'on_end': None}
-    # import the models file
-    models_name = "{0}.models".format(app_label)
-    try:
-        models = import_module(models_name)
-    except ImportError:
-        raise http.Http404('No module name {0}.'.format(models_name))
+    entry = registry.get(app_label, document_name)
+    if entry is None:
+        raise http.Http404("No MongoAdmin for {0}.{1}".format(app_label, document_name))
 
-    document = getattr(models, document_name)
+    document = entry.document
     instance = get_document_or_404(document.objects, pk=id)
     func = getattr(instance, func_name, None)
     try:
@@ -9,7 +9,7 @@ from mongoengine import (DateTimeField, BooleanField, Document,
                          EmbeddedDocument, EmbeddedDocumentField,
                          ListField, ReferenceField)
 from mongonaut.fields import (AdminStringField, AdminEmailField,
-                              AdminUnsignedIntField)
+                              AdminUnsignedIntField, AdminReferenceField)
 
 from datetime import datetime
 
@@ -20,10 +20,23 @@ class User(Document):
     age = AdminUnsignedIntField()
     user_name = AdminStringField(max_length=50)
 
+    # searched by the ReferenceField selects.
+    reference_display_field = 'user_name'
+
+    meta = {'indexes': ['user_name']}
+
     def __unicode__(self):
         return self.user_name
 
 
+class Category(Document):
+    """Small lookup collection, see Post.category."""
+    name = AdminStringField(max_length=30, required=True)
+
+    def __unicode__(self):
+        return self.name
+
+
 class Comment(EmbeddedDocument):
     message = AdminStringField(default="DEFAULT EMBEDDED COMMENT", verbose_name="信息")
     author = ReferenceField(User)
@@ -55,6 +68,7 @@ class Post(Document):
                              unique=True, verbose_name="标题")
     content = AdminStringField(default="I am default content")
     author = ReferenceField(User)
+    category = AdminReferenceField(Category, cache_choices=True)
     created_date = DateTimeField()
     published = BooleanField()
     creator = EmbeddedDocumentField(EmbeddedUser)
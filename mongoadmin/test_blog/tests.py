@@ -1,15 +1,46 @@
 #coding: utf-8
+import datetime
+import gzip
+import io
+import json
+import shutil
+import tempfile
+import time
+
+from django.core.cache import cache
+from django.core.management import call_command
 from django.test import TestCase
 from django.test import RequestFactory
 from django.core.urlresolvers import reverse
 from django.conf import settings
-from django.contrib.auth.models import User, Permission, AnonymousUser
+from django.contrib.auth.models import User, Group, Permission, AnonymousUser
+from django.contrib.admin.models import LogEntry
 
+from bson.dbref import DBRef
+from bson.objectid import ObjectId
+from bson.tz_util import utc
+from mongoengine import Document, IntField, ReferenceField
 from mongoengine.errors import DoesNotExist
 
 from mongonaut.views import (DocumentAddFormView, DocumentListView,
                              DocumentDetailView, DocumentEditFormView)
-from test_blog.models import Post
+from mongonaut.paging import (get_sort_keys, get_order_by, get_cursor_query,
+                              get_cursor_values, encode_cursor, decode_cursor,
+                              count_estimated, count_capped, count_cached)
+from mongonaut.utils import (prefetch_references, trim_field_key, RawRow, translate_value,
+                            get_missing_references, get_document_ids)
+from mongonaut.permissions import get_user_cached, load_permissions, get_version, VERSION_KEY
+from mongonaut.registry import registry
+from mongonaut import list_editor
+from mongonaut.jobs import (MongonautJob, create_job, claim_job, run_job, get_export_storage,
+                            JOB_DONE, JOB_RUNNING)
+from mongonaut.forms.forms import MongoModelForm, FORM_SCHEMAS
+from mongonaut.reference_cache import get_cached_choices, is_registered, register_references
+from mongonaut.fields import AdminReferenceField, AdminIntSelectField, AdminStringField
+from mongonaut.templatetags.mongonaut_tags import get_columns, render_rows
+from mongonaut.filters.filterset import FilterSet
+from mongonaut.filters.filters import DateFilter
+from test_blog.models import Post, EmbeddedUser, Category, User as BlogUser
 from test_blog.mongoadmin import PostAdmin
 
 
@@ -80,6 +111,77 @@ class MongoAdminTests(TestCase):
         self.assertEqual(response.status_code, 302)
         self.assertTrue(response.url.endswith(url_path))
 
+    def test_permission_snapshot(self):
+        self.add_permission('view')
+        self.add_permission('change')
+        permissions = load_permissions(self.user)
+        self.assertEqual(permissions, frozenset([
+            "{0}.view_{1}".format(APP_LABEL, self.post_sql_name),
+            "{0}.change_{1}".format(APP_LABEL, self.post_sql_name)]))
+
+    def test_reference_choices(self):
+        users = [BlogUser.objects.create(email='u%d@test.com' % i, user_name=u'user%02d' % i)
+                 for i in range(25)]
+        self.assertTrue(self.client.login(**ADMIN_UINFO))
+        url_path = reverse('document_reference', kwargs=self.com_kwargs)
+        response = self.client.get(url_path, {'field': 'past_authors_3', 'q': u'user1'})
+        data = json.loads(response.content)
+        self.assertEqual([result['text'] for result in data['results']],
+                         [u'user%02d' % i for i in range(10, 20)])
+        self.assertEqual(data['next'], None)
+
+        response = self.client.get(url_path, {'field': 'author'})
+        data = json.loads(response.content)
+        self.assertEqual(len(data['results']), 20)
+        response = self.client.get(url_path, {'field': 'author', 'after': data['next']})
+        self.assertEqual(len(json.loads(response.content)['results']), 5)
+        for user in users:
+            user.delete()
+
+    def test_reference_choices_permission(self):
+        url_path = reverse('document_reference', kwargs=self.com_kwargs)
+        # view permission does not list the referenced collection.
+        self.add_permission('view')
+        self.assertTrue(self.client.login(**NORMAL_UINFO))
+        self.assertEqual(self.client.get(url_path, {'field': 'author'}).status_code, 403)
+
+        self.add_permission('change')
+        self.assertEqual(self.client.get(url_path, {'field': 'author'}).status_code, 200)
+
+    def test_bulk_edit(self):
+        posts = [Post.objects.create(title=u'bulk%d' % i) for i in range(3)]
+        self.assertTrue(self.client.login(**ADMIN_UINFO))
+        url_path = reverse('document_bulk_edit', kwargs=self.com_kwargs)
+        selection = {'mongo_id': [unicode(posts[0].id), unicode(posts[1].id)]}
+        # the selection of list, then the field chooser.
+        response = self.client.post(url_path, selection)
+        self.assertEqual(response.context['form'], None)
+        response = self.client.post(url_path, dict(selection, fields=['content', 'title']))
+        # unique fields are not bulk edited.
+        self.assertEqual(response.context['form'].fields.keys(), ['content'])
+        self.assertEqual(response.context['hidden_params'],
+                         [('mongo_id', unicode(posts[0].id)), ('mongo_id', unicode(posts[1].id)),
+                          ('fields', 'content')])
+
+        response = self.client.post(url_path, dict(selection, fields=['content'], action=u'保存',
+                                                   content=u'bulk content'))
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual([post.reload().content for post in posts],
+                         [u'bulk content', u'bulk content', u'I am default content'])
+        self.assertEqual(LogEntry.objects.filter(object_repr=u'Post x 2').count(), 1)
+
+        # the whole collection needs an active filter.
+        save = {'fields': 'content', 'action': u'保存', 'content': u'everything'}
+        self.client.post(url_path + '?scope=filtered', save)
+        # no-op search, the query of the collection.
+        self.client.post(url_path + '?scope=filtered&q=&select=title', save)
+        self.assertEqual(Post.objects(content=u'everything').count(), 0)
+        response = self.client.post(url_path + '?scope=filtered&q=bulk2&select=title',
+                                    dict(save, content=u'filtered'))
+        self.assertEqual(posts[2].reload().content, u'filtered')
+        for post in posts:
+            post.delete()
+
     def test_has_post_add_permission(self):
         self.post_user_permission_test('add', 'document_detail_add_form',
                                        DocumentAddFormView)
@@ -175,3 +277,589 @@ class MongoAdminTests(TestCase):
         self.assertEqual(response.status_code, 302)
         # url like: http://testserver/login/?next=/mongoadmin/test_blog/Post/55530417f02ede188891a027/delete/
         self.assertTrue(response.url.endswith(url_path))
+
+
+class CursorPagingTests(TestCase):
+
+    def test_sort_keys(self):
+        sort_keys = get_sort_keys(Post, ['-created_date'])
+        self.assertEqual(sort_keys, [('created_date', 'created_date', -1),
+                                     ('id', '_id', 1)])
+        self.assertEqual(get_order_by(sort_keys), ['-created_date', '+id'])
+        self.assertEqual(get_order_by(sort_keys, reverse=True), ['+created_date', '-id'])
+        # without ordering, page on _id only.
+        self.assertEqual(get_sort_keys(Post, None), [('id', '_id', 1)])
+
+    def test_custom_primary_key(self):
+        documents = [IntKeyDocument.objects.create(number=i) for i in (3, 1, 2)]
+        sort_keys = get_sort_keys(IntKeyDocument, ['-number'])
+        self.assertEqual(sort_keys, [('number', '_id', -1)])
+        sort_keys = get_sort_keys(IntKeyDocument, None)
+        queryset = IntKeyDocument.objects.order_by(*get_order_by(sort_keys))
+        first = queryset.first()
+        self.assertEqual(get_cursor_values(first, sort_keys), [1])
+        query = get_cursor_query(sort_keys, get_cursor_values(first, sort_keys))
+        self.assertEqual([document.pk for document in queryset(__raw__=query)], [2, 3])
+        for document in documents:
+            document.delete()
+
+    def test_cursor_query(self):
+        sort_keys = get_sort_keys(Post, ['-created_date'])
+        query = get_cursor_query(sort_keys, [1, 2])
+        self.assertEqual(query, {'$or': [{'$or': [{'created_date': {'$lt': 1}},
+                                                  {'created_date': None}]},
+                                         {'created_date': 1, '_id': {'$gt': 2}}]})
+        query = get_cursor_query(sort_keys, [1, 2], reverse=True)
+        self.assertEqual(query, {'$or': [{'created_date': {'$gt': 1}},
+                                         {'created_date': 1, '_id': {'$lt': 2}}]})
+
+    def test_cursor_null_values(self):
+        dates = [None, None, datetime.datetime(2015, 1, 1), datetime.datetime(2015, 1, 2)]
+        posts = [Post.objects.create(title=u'null%d' % i, created_date=date)
+                 for i, date in enumerate(dates)]
+        for ordering in (['created_date'], ['-created_date']):
+            sort_keys = get_sort_keys(Post, ordering)
+            queryset = Post.objects.order_by(*get_order_by(sort_keys))
+            expected = [post.id for post in queryset]
+            # one document per page, through the null group.
+            seen, documents = [], list(queryset.limit(1))
+            while documents:
+                seen.append(documents[0].id)
+                query = get_cursor_query(sort_keys, get_cursor_values(documents[0], sort_keys))
+                documents = list(queryset(__raw__=query).limit(1))
+            self.assertEqual(seen, expected)
+        for post in posts:
+            post.delete()
+
+    def test_cursor_token(self):
+        sort_keys = get_sort_keys(Post, ['-created_date'])
+        values = [datetime.datetime(2015, 5, 22, 12, 6, 9, tzinfo=utc), ObjectId()]
+        self.assertEqual(decode_cursor(encode_cursor(values), sort_keys), values)
+        with self.assertRaises(ValueError):
+            decode_cursor('broken', sort_keys)
+        with self.assertRaises(ValueError):
+            decode_cursor(encode_cursor(values[:1]), sort_keys)
+
+
+class CountStrategyTests(TestCase):
+
+    def setUp(self):
+        for i in range(5):
+            Post.objects.create(title=u'count%d' % i)
+        self.mongoadmin = PostAdmin()
+
+    def tearDown(self):
+        Post.drop_collection()
+        cache.clear()
+
+    def test_count_capped(self):
+        self.mongoadmin.count_cap = 3
+        self.assertEqual(count_capped(Post.objects, self.mongoadmin), (3, False))
+        self.mongoadmin.count_cap = 5
+        self.assertEqual(count_capped(Post.objects, self.mongoadmin), (5, True))
+        self.assertEqual(count_capped(Post.objects(title=u'count1'), self.mongoadmin), (1, True))
+
+    def test_count_estimated(self):
+        self.assertEqual(count_estimated(Post.objects, self.mongoadmin), (5, True))
+        # exact with a filter.
+        self.assertEqual(count_estimated(Post.objects(title=u'count1'), self.mongoadmin), (1, True))
+
+    def test_count_cached(self):
+        cache.clear()
+        self.assertEqual(count_cached(Post.objects, self.mongoadmin), (5, True))
+        Post.objects.create(title=u'count5')
+        self.assertEqual(count_cached(Post.objects, self.mongoadmin), (5, True))
+        # cached per query.
+        self.assertEqual(count_cached(Post.objects(title=u'count5'), self.mongoadmin), (1, True))
+
+    def test_capped_display(self):
+        User.objects.create_superuser(**ADMIN_UINFO)
+        mongoadmin = registry.get(APP_LABEL, DOCUMENT_NAME).mongoadmin
+        mongoadmin.count_strategy, mongoadmin.count_cap = 'capped', 3
+        try:
+            self.assertTrue(self.client.login(**ADMIN_UINFO))
+            response = self.client.get(reverse('document_list', kwargs={
+                'app_label': APP_LABEL, 'document_name': DOCUMENT_NAME}))
+        finally:
+            del mongoadmin.count_strategy, mongoadmin.count_cap
+        self.assertEqual(response.context['total_count_display'], u'3+')
+        self.assertEqual(response.context['total_pages'], None)
+
+
+class PrefetchReferencesTests(TestCase):
+
+    def setUp(self):
+        self.author = BlogUser.objects.create(email='author@126.com', user_name='author')
+        self.post = Post.objects.create(title='prefetch', author=self.author,
+                                        past_authors=[self.author, self.author])
+
+    def tearDown(self):
+        self.post.delete()
+        self.author.delete()
+
+    def test_prefetch_references(self):
+        post = Post.objects.get(id=self.post.id)
+        prefetch_references([post])
+        self.assertIsInstance(post._data['author'], BlogUser)
+        self.assertEqual([author.id for author in post._data['past_authors']],
+                         [self.author.id, self.author.id])
+        self.assertEqual(post.author.user_name, 'author')
+
+    def test_prefetch_only_keys(self):
+        post = Post.objects.get(id=self.post.id)
+        prefetch_references([post], keys=['author'])
+        self.assertIsInstance(post._data['author'], BlogUser)
+        self.assertNotIsInstance(post._data['past_authors'][0], BlogUser)
+
+
+class RawRowTests(TestCase):
+
+    def test_raw_row(self):
+        son = {'_id': ObjectId(), 'title': u'raw', 'author': ObjectId()}
+        row = RawRow(Post, son)
+        self.assertEqual(row.id, son['_id'])
+        self.assertEqual(row.pk, son['_id'])
+        self.assertEqual(row.title, u'raw')
+        # ReferenceField is converted for prefetch_references.
+        self.assertIsInstance(row._data['author'], DBRef)
+        # not loaded
+        self.assertEqual(row.content, None)
+        self.assertEqual(getattr(row, 'transform_title', None), None)
+
+    def test_custom_primary_key(self):
+        row = RawRow(IntKeyDocument, {'_id': 7})
+        self.assertEqual(row.id, 7)
+        self.assertEqual(row.pk, 7)
+        self.assertEqual(row.number, 7)
+
+
+class DocumentPlanTests(TestCase):
+
+    def test_plan(self):
+        mongoadmin = PostAdmin()
+        plan = mongoadmin.get_plan(Post)
+        self.assertEqual(plan.list_keys[0], 'id')
+        self.assertNotIn('creator', plan.list_keys)
+        self.assertNotIn('tags', plan.list_keys)
+        self.assertEqual(plan.embedded_keys, ('creator', ))
+        self.assertIn('tags', plan.detail_list_keys)
+        self.assertEqual([column.key for column in plan.columns], list(plan.list_keys))
+        # built once, admin config is not changed.
+        self.assertIs(mongoadmin.get_plan(Post), plan)
+        self.assertEqual(mongoadmin.list_fields, [])
+
+
+class ColumnDocument(Document):
+    """Columns rendered by the list, see ColumnTests."""
+    name = AdminStringField(verbose_name=u'名称')
+    status = AdminIntSelectField(choices=((1, u'open'), (2, u'closed')))
+    owner = ReferenceField(BlogUser)
+
+
+class ColumnTests(TestCase):
+
+    def tearDown(self):
+        ColumnDocument.drop_collection()
+        BlogUser.drop_collection()
+
+    def test_columns(self):
+        columns = get_columns(ColumnDocument, ('id', 'name', 'status', 'owner'))
+        self.assertEqual([column.key for column in columns], ['id', 'name', 'status', 'owner'])
+        self.assertEqual(columns[0].label, u'序号')
+        self.assertEqual(columns[0].render, None)
+        self.assertEqual(columns[1].label, u'名称')
+
+    def test_render_rows(self):
+        owner = BlogUser.objects.create(email='owner@test.com', user_name=u'owner')
+        ColumnDocument.objects.create(name=u'column', status=2, owner=owner)
+        columns = get_columns(ColumnDocument, ('id', 'name', 'status', 'owner'))
+
+        document = ColumnDocument.objects.first()
+        (row_document, cells), = render_rows(columns, [document])
+        self.assertIs(row_document, document)
+        self.assertEqual(cells[:2], [u'column', u'closed'])
+        url = reverse('document_detail', kwargs={'app_label': APP_LABEL, 'document_name': 'User',
+                                                 'id': owner.pk})
+        self.assertEqual(cells[2], u'<a href="{0}">owner</a>'.format(url))
+
+        # AdminReferenceField is linked as ReferenceField.
+        render = get_columns(Post, ('category', ))[0].render
+        news = Category(id=ObjectId(), name=u'news')
+        self.assertIn(u'>news</a>', render(Post(category=news)))
+
+        # raw rows render the same cells.
+        son = ColumnDocument.objects.as_pymongo().first()
+        raw_rows = prefetch_references([RawRow(ColumnDocument, son)])
+        self.assertEqual(render_rows(columns, raw_rows)[0][1], cells)
+
+
+class ListProjectionTests(TestCase):
+
+    def tearDown(self):
+        Post.drop_collection()
+
+    def test_only_fields(self):
+        plan = PostAdmin().get_plan(Post)
+        self.assertEqual(set(plan.only_fields), set(plan.list_keys) - set(['id']))
+        self.assertNotIn('tags', plan.only_fields)
+
+        mongoadmin = PostAdmin()
+        mongoadmin.ordering = ['-created_date', '+creator.email']
+        mongoadmin.list_fields = ['title']
+        mongoadmin.list_extra_fields = ['tags', 'no_such_field']
+        self.assertEqual(set(mongoadmin.get_plan(Post).only_fields),
+                         set(['title', 'created_date', 'creator', 'tags']))
+
+    def test_list_queryset(self):
+        User.objects.create_superuser(**ADMIN_UINFO)
+        Post.objects.create(title=u'projected', tags=[u'tag'])
+        self.assertTrue(self.client.login(**ADMIN_UINFO))
+        response = self.client.get(reverse('document_list', kwargs={
+            'app_label': APP_LABEL, 'document_name': DOCUMENT_NAME}))
+        post, = response.context['object_list']
+        self.assertEqual(post.title, u'projected')
+        # not loaded, ListField is not a column.
+        self.assertEqual(post.tags, [])
+
+
+class RegistryTests(TestCase):
+
+    def test_registry(self):
+        entry = registry.get('test_blog', 'Post')
+        self.assertIs(entry.document, Post)
+        self.assertIs(entry.mongoadmin, Post.mongoadmin)
+        self.assertEqual(registry.get('test_blog', 'NoSuchDocument'), None)
+        # built once.
+        self.assertIs(registry.get_apps(), registry.get_apps())
+
+    def test_operation_not_registered(self):
+        url_path = reverse('document_operation', kwargs={
+            'app_label': APP_LABEL, 'document_name': 'NoSuchDocument',
+            'id': unicode(ObjectId()), 'func_name': 'publish'})
+        self.assertEqual(self.client.get(url_path).status_code, 404)
+
+
+class UserCacheTests(TestCase):
+
+    def test_invalidation(self):
+        user = User.objects.create_user(**NORMAL_UINFO)
+        calls = []
+
+        def build(user):
+            calls.append(user.pk)
+            return len(calls)
+
+        self.assertEqual(get_user_cached('mongonaut_navigation', user, build), 1)
+        self.assertEqual(get_user_cached('mongonaut_navigation', user, build), 1)
+        # permission of user changed.
+        user.user_permissions.add(Permission.objects.all()[0])
+        self.assertEqual(get_user_cached('mongonaut_navigation', user, build), 2)
+        # groups changed.
+        Group.objects.create(name='mongonaut')
+        self.assertEqual(get_user_cached('mongonaut_navigation', user, build), 3)
+
+    def test_version_evicted(self):
+        user = User.objects.create_user(**NORMAL_UINFO)
+        self.assertEqual(get_user_cached('mongonaut_permissions', user, lambda user: 'old'), 'old')
+        version = get_version()
+        # the version key is evicted, old snapshots are not served again.
+        cache.delete(VERSION_KEY)
+        time.sleep(0.002)
+        self.assertGreater(get_version(), version)
+        self.assertEqual(get_user_cached('mongonaut_permissions', user, lambda user: 'new'), 'new')
+
+
+class FormSchemaTests(TestCase):
+
+    def test_schema_cached(self):
+        form = MongoModelForm(model=Post).get_form()
+        schema = FORM_SCHEMAS[Post]
+        widget_class = schema.form_field_dict['title'].widget.attrs['class']
+        MongoModelForm(model=Post).get_form()
+        self.assertIs(FORM_SCHEMAS[Post], schema)
+        # prototypes are not changed by forms.
+        self.assertEqual(schema.form_field_dict['title'].widget.attrs['class'], widget_class)
+        self.assertIsNot(form.fields['title'].widget, schema.form_field_dict['title'].widget)
+
+    def test_media_cached(self):
+        post = Post(title=u'dates', published_dates=[datetime.datetime(2015, 1, 1)] * 3)
+        form = MongoModelForm(model=Post, instance=post).get_form()
+        self.assertIs(form.media, FORM_SCHEMAS[Post].media)
+        # each script once, however many date widgets.
+        scripts = form.media._js
+        self.assertEqual(len(scripts), len(set(scripts)))
+        rendered = str(form.validations)
+        self.assertIs(form.validations.render_text, FORM_SCHEMAS[Post].validations.render_text)
+        self.assertEqual(form.validations.render_text, rendered)
+
+    def test_large_list_field(self):
+        post = Post(title=u'tags', tags=[u'tag%d' % i for i in range(2000)])
+        form = MongoModelForm(model=Post, instance=post).get_form()
+        self.assertEqual(form.fields['tags_0'].initial, u'tag0')
+        self.assertEqual(form.fields['tags_1999'].initial, u'tag1999')
+        self.assertIn('tags_1999', form.fields['tags_1999'].widget.attrs['class'])
+        self.assertNotIn('tags_1998', form.fields['tags_1999'].widget.attrs['class'])
+
+    def test_list_field_linear(self):
+        def build_time(size):
+            post = Post(title=u'tags', tags=[u'tag%d' % i for i in range(size)])
+            timings = []
+            for _ in range(3):
+                started = time.time()
+                MongoModelForm(model=Post, instance=post).get_form()
+                timings.append(time.time() - started)
+            return min(timings)
+
+        build_time(100)
+        # 4x elements: about 4x time when linear, 16x when quadratic.
+        ratio = build_time(4000) / max(build_time(1000), 1e-6)
+        self.assertLess(ratio, 8)
+
+    def test_post_list_elements(self):
+        post = Post(title=u'tags', tags=[u'a'])
+        form = MongoModelForm(model=Post, instance=post,
+                              form_post_data={'title': u'tags', 'tags_0': u'a', 'tags_1': u'b',
+                                              'old_tags_0': u'c'}).get_form()
+        self.assertIn('tags_1', form.fields)
+        # `tags` is not a prefix match of `old_tags`.
+        self.assertNotIn('old_tags_0', form.fields)
+
+
+class FieldKeyResolverTests(TestCase):
+
+    def test_trim_field_key(self):
+        self.assertEqual(trim_field_key(Post, 'published_dates_3'), ('published_dates', ['3']))
+        self.assertEqual(trim_field_key(Post(), 'comments_message_0'),
+                         ('comments', ['message', '0']))
+        self.assertEqual(trim_field_key(EmbeddedUser, 'friends_list_0'), ('friends_list', ['0']))
+        self.assertEqual(trim_field_key(Post, 'creator_user_name'), ('creator', ['user', 'name']))
+
+
+class ListEditorTests(TestCase):
+
+    def setUp(self):
+        self.post = Post.objects.create(title=u'list', tags=[u'a', u'b', u'c', u'd', u'e'])
+        self.field = Post._fields['tags']
+
+    def tearDown(self):
+        self.post.delete()
+
+    def test_list_page(self):
+        elements, length = list_editor.get_list_page(Post, self.post.pk, self.field, 2, 2)
+        self.assertEqual(length, 5)
+        self.assertEqual([(e['index'], e['value']) for e in elements], [(2, u'c'), (3, u'd')])
+
+    def test_list_updates(self):
+        elements, _ = list_editor.get_list_page(Post, self.post.pk, self.field, 1, 5)
+        raw = list_editor.parse_raw(elements[1]['raw'])
+        self.assertTrue(list_editor.set_element(Post, self.post.pk, self.field, 1, raw, u'x'))
+        # element changed meanwhile.
+        self.assertFalse(list_editor.set_element(Post, self.post.pk, self.field, 1, raw, u'y'))
+        list_editor.push_element(Post, self.post.pk, self.field,
+                                 list_editor.parse_element(self.field.field, '"f"'))
+        list_editor.pull_element(Post, self.post.pk, self.field, 0, u'a')
+        self.assertEqual(Post.objects.get(pk=self.post.pk).tags, [u'x', u'c', u'd', u'e', u'f'])
+
+    def test_pull_duplicate(self):
+        Post.objects(pk=self.post.pk).update_one(set__tags=[u'a', u'b', u'a'])
+        # element changed meanwhile.
+        self.assertFalse(list_editor.pull_element(Post, self.post.pk, self.field, 1, u'a'))
+        self.assertTrue(list_editor.pull_element(Post, self.post.pk, self.field, 2, u'a'))
+        self.assertEqual(Post.objects.get(pk=self.post.pk).tags, [u'a', u'b'])
+
+
+class ReferenceCacheTests(TestCase):
+
+    def tearDown(self):
+        Category.drop_collection()
+
+    def test_cached_choices(self):
+        news = Category.objects.create(name=u'news')
+        self.assertEqual(get_cached_choices(Category), [(unicode(news.pk), u'news')])
+        # no query while unchanged.
+        Category.objects(pk=news.pk).update(set__name=u'renamed')
+        self.assertEqual(get_cached_choices(Category), [(unicode(news.pk), u'news')])
+
+        # post_save invalidates.
+        sport = Category.objects.create(name=u'sport')
+        self.assertEqual(dict(get_cached_choices(Category)),
+                         {unicode(news.pk): u'renamed', unicode(sport.pk): u'sport'})
+        sport.delete()
+        self.assertEqual(get_cached_choices(Category), [(unicode(news.pk), u'renamed')])
+
+    def test_form_choices(self):
+        news = Category.objects.create(name=u'news')
+        post = Post(title=u'categorized', category=news)
+        form = MongoModelForm(model=Post, instance=post).get_form()
+        field = form.fields['category']
+        self.assertEqual(field.initial, unicode(news.pk))
+        self.assertEqual(field.choices, [(u'', u''), (unicode(news.pk), u'news')])
+
+
+class LazyReferrer(Document):
+    """References a Document defined below by class name."""
+    lookup = AdminReferenceField('LazyLookup', cache_choices=True)
+
+
+class LazyLookup(Document):
+    name = IntField()
+
+
+class LazyReferenceTests(TestCase):
+
+    def test_register_by_name(self):
+        self.assertFalse(is_registered(LazyLookup))
+        register_references(LazyReferrer)
+        self.assertTrue(is_registered(LazyLookup))
+
+
+class ReferenceValueTests(TestCase):
+
+    def test_translate_without_fetch(self):
+        author = BlogUser.objects.create(email='ref@126.com', user_name='ref')
+        missing = ObjectId()
+        self.assertEqual(get_missing_references({BlogUser: set([author.id, missing])}),
+                         set([(BlogUser, missing)]))
+
+        value = translate_value(Post.author, unicode(author.id))
+        self.assertEqual(value, DBRef(BlogUser._get_collection_name(), author.id))
+        post = Post(title=u'ref', author=value, past_authors=[value, value])
+        post.validate()
+        self.assertEqual(post.to_mongo()['past_authors'], [author.id, author.id])
+        author.delete()
+
+
+class PostFilter(FilterSet):
+    created_date = DateFilter()
+
+    class Meta:
+        model = Post
+        fields = ['created_date']
+
+
+class DeleteJobTests(TestCase):
+
+    com_kwargs = {'app_label': APP_LABEL, 'document_name': DOCUMENT_NAME}
+
+    def setUp(self):
+        self.super_user = User.objects.create_superuser(**ADMIN_UINFO)
+        for i in range(5):
+            Post.objects.create(title=u'job%d' % i)
+        Post.objects.create(title=u'keep')
+
+    def tearDown(self):
+        Post.drop_collection()
+        MongonautJob.drop_collection()
+
+    def test_run_delete_job(self):
+        job = create_job('delete', APP_LABEL, DOCUMENT_NAME,
+                         Post.objects(title__startswith=u'job'), batch_size=2)
+        claimed = claim_job()
+        self.assertEqual(claimed.id, job.id)
+        self.assertEqual(claimed.status, JOB_RUNNING)
+        # claimed once.
+        self.assertEqual(claim_job(), None)
+
+        run_job(claimed)
+        job.reload()
+        self.assertEqual(job.status, JOB_DONE)
+        self.assertEqual(job.processed, 5)
+        self.assertEqual([post.title for post in Post.objects], [u'keep'])
+
+    def test_worker_command(self):
+        job = create_job('delete', APP_LABEL, DOCUMENT_NAME, Post.objects(title=u'job0'))
+        call_command('mongonaut_worker', once=True)
+        self.assertEqual(job.reload().status, JOB_DONE)
+        self.assertEqual(Post.objects.count(), 5)
+
+    def test_delete_filtered(self):
+        self.assertTrue(self.client.login(**ADMIN_UINFO))
+        url_path = reverse('document_list', kwargs=self.com_kwargs)
+        # no filter, no job.
+        self.client.post(url_path, {'action': 'delete_filtered'})
+        self.assertEqual(MongonautJob.objects.count(), 0)
+
+        self.client.post(url_path + '?q=job&select=title', {'action': 'delete_filtered'})
+        job = MongonautJob.objects.get()
+        self.assertEqual(job.total, 5)
+
+        response = self.client.get(reverse('document_job', kwargs=dict(self.com_kwargs,
+                                                                      job_id=job.id)))
+        data = json.loads(response.content)
+        self.assertEqual(data['kind'], 'delete')
+        self.assertEqual(data['status'], 'pending')
+
+    def test_delete_invalid_filter(self):
+        mongoadmin = registry.get(APP_LABEL, DOCUMENT_NAME).mongoadmin
+        mongoadmin.filterobject = PostFilter
+        try:
+            self.assertTrue(self.client.login(**ADMIN_UINFO))
+            url_path = reverse('document_list', kwargs=self.com_kwargs)
+            # invalid value, the filter gives none() whose query is {}.
+            self.client.post(url_path + '?created_date=garbage', {'action': 'delete_filtered'})
+            # no-op, the query of the collection.
+            self.client.post(url_path + '?created_date=', {'action': 'delete_filtered'})
+            self.client.post(url_path + '?q=&select=title', {'action': 'delete_filtered'})
+        finally:
+            del mongoadmin.filterobject
+        self.assertEqual(MongonautJob.objects.count(), 0)
+        self.assertEqual(Post.objects.count(), 6)
+
+
+class ExportJobTests(TestCase):
+
+    com_kwargs = {'app_label': APP_LABEL, 'document_name': DOCUMENT_NAME}
+
+    def setUp(self):
+        self.export_root = tempfile.mkdtemp()
+        self.settings_override = self.settings(MONGONAUT_EXPORT_ROOT=self.export_root)
+        self.settings_override.enable()
+        self.super_user = User.objects.create_superuser(**ADMIN_UINFO)
+        self.user = User.objects.create_user(**NORMAL_UINFO)
+        for i in range(3):
+            Post.objects.create(title=u'export%d' % i)
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.export_root)
+        Post.drop_collection()
+        MongonautJob.drop_collection()
+
+    def test_export_job(self):
+        job = create_job('export', APP_LABEL, DOCUMENT_NAME, Post.objects, user=self.super_user,
+                         export_format='csv', keys=['id', 'title'], batch_size=2)
+        run_job(claim_job())
+        job.reload()
+        self.assertEqual(job.status, JOB_DONE)
+        self.assertEqual(job.processed, 3)
+        # outside public media, downloaded through the view.
+        self.assertTrue(get_export_storage().path(job.result_file).startswith(self.export_root))
+        url_path = reverse('document_job_download', kwargs=dict(self.com_kwargs, job_id=job.id))
+        self.assertEqual(job.to_json()['result_url'], url_path)
+
+        # anonymous users are sent to login.
+        self.assertEqual(self.client.get(url_path).status_code, 302)
+
+        # no view permission.
+        self.assertTrue(self.client.login(**NORMAL_UINFO))
+        self.assertEqual(self.client.get(url_path).status_code, 403)
+
+        self.assertTrue(self.client.login(**ADMIN_UINFO))
+        response = self.client.get(url_path)
+        self.assertEqual(response.status_code, 200)
+        content = gzip.GzipFile(fileobj=io.BytesIO(''.join(response.streaming_content))).read()
+        for i in range(3):
+            self.assertIn('export%d' % i, content)
+
+
+class IntKeyDocument(Document):
+    """Document with a custom primary key."""
+    number = IntField(primary_key=True)
+
+
+class DocumentIdsTests(TestCase):
+
+    def test_document_ids(self):
+        self.assertEqual(get_document_ids(IntKeyDocument, ['1', '20', 'x', '']), [1, 20])
+        object_id = ObjectId()
+        self.assertEqual(get_document_ids(Post, [unicode(object_id), '1']), [object_id])